@@ -42,6 +42,8 @@ class Administration(commands.Cog):
         log = settings.get('log', 'None set')
         if isinstance(log, int):
             log = f'<#{log}>'
+            if settings.get('logWebhook'):
+                log += ' (webhook)'
         
         channel_ids = settings.get('disabledChannels')
         if channel_ids:
@@ -98,6 +100,7 @@ class Administration(commands.Cog):
                 {'guildId':ctx.guild.id},
                 {'$set':{'prefixes':prefixes}}
             )
+            self.bot.settings_cache.invalidate(ctx.guild.id)
             
         await ctx.tick(True)
         
@@ -117,6 +120,7 @@ class Administration(commands.Cog):
                 {'guildId':ctx.guild.id},
                 {'$set':{'prefixes':prefixes}}
             )
+            self.bot.settings_cache.invalidate(ctx.guild.id)
         await ctx.tick(True)
         
     @commands.has_guild_permissions(manage_guild=True)
@@ -132,6 +136,35 @@ class Administration(commands.Cog):
                 {'guildId':ctx.guild.id},
                 {'$set':{'log':channel.id if channel else None}}
             )
+            self.bot.settings_cache.invalidate(ctx.guild.id)
+            for channel_id in (settings.get('log'), channel and channel.id):
+                if channel_id:
+                    self.bot.log_dispatcher.webhooks.invalidate(channel_id)
+        await ctx.tick(True)
+        
+    @commands.has_guild_permissions(manage_guild=True)
+    @settings.command(name='logmode')
+    async def logmode(self, ctx: Context, *, mode: str):
+        """Sets how logs are delivered to the log channel.
+        
+        `webhook`: Through a webhook, so logging doesn't slow down the bot's replies.
+        `channel`: Sent by the bot itself.
+        """
+        if mode not in ('webhook', 'channel'):
+            return await ctx.send('The mode should either be `webhook` or `channel`.')
+        
+        settings = await self.bot.settings.find_one({'guildId':ctx.guild.id})
+        if settings is None:
+            return await ctx.send(f'Please run `{ctx.clean_prefix}setup` first.')
+        else:
+            await self.bot.settings.update_one(
+                {'guildId':ctx.guild.id},
+                {'$set':{'logWebhook':mode == 'webhook'}}
+            )
+            self.bot.settings_cache.invalidate(ctx.guild.id)
+            if settings.get('log'):
+                # e.g. after granting Manage Webhooks, try making the webhook again
+                self.bot.log_dispatcher.webhooks.invalidate(settings['log'])
         await ctx.tick(True)
         
     @commands.has_guild_permissions(manage_guild=True)
@@ -160,6 +193,7 @@ class Administration(commands.Cog):
             {'guildId':ctx.guild.id},
             {'$set':{'disabledChannels': channels}}
         )
+        self.bot.settings_cache.invalidate(ctx.guild.id)
         
         await ctx.tick(True)
         await ctx.send(f'Commands succesfully **{update}** for `#{channel.name}`!')
@@ -173,10 +207,12 @@ class Administration(commands.Cog):
             'guildId':ctx.guild.id,
             'prefixes':['.'],
             'log':None,
+            'logWebhook':False,
             'disabledChannels':[]
         }
         
         await self.bot.settings.insert_one(document)
+        self.bot.settings_cache.invalidate(ctx.guild.id)
         
         await ctx.send('Server has been setup successfully!')
         await ctx.tick(True)
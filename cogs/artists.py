@@ -18,10 +18,11 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from __future__ import annotations
 
+import csv
 import discord
+import io
 
-from discord.ext import commands, menus
-from difflib import get_close_matches
+from discord.ext import commands, menus, tasks
 from typing import Optional
 
 from utils.paginator import ArtistPages
@@ -29,12 +30,41 @@ from utils.bot import Bot
 from utils.context import Context
 from utils.flags import ArtistAdd, ArtistEdit
 from utils.checks import admin, botchannel
-from utils.utils import Artist
+from utils.utils import Artist, Embed
+from utils.artists import (
+    ALL_ARTISTS_SORT,
+    POPULAR_ARTISTS_LIMIT,
+    POPULAR_ARTISTS_SORT,
+    UNIQUE_ARTISTS_SORT,
+    ArtistWriter,
+    artist_document,
+    find_artist,
+    read_artist_rows
+)
+from pymongo.errors import BulkWriteError
+
+IMPORT_CHUNK_SIZE = 500
 
     
 class Artists(commands.Cog):
     def __init__(self, bot: Bot):
         self.bot = bot
+        self.flush_searches.start()
+        
+    def cog_unload(self) -> None:
+        self.flush_searches.cancel()
+        self.bot.loop.create_task(self.bot.search_counter.flush())
+        
+    @tasks.loop(seconds=30.0)
+    async def flush_searches(self) -> None:
+        try:
+            await self.bot.search_counter.flush()
+        except Exception as e:
+            print(f'Failed to flush artist searches: {e}')
+        
+    @flush_searches.before_loop
+    async def before_flush_searches(self) -> None:
+        await self.bot.wait_until_ready()
         
     async def get_artist(
         self, 
@@ -44,8 +74,9 @@ class Artists(commands.Cog):
         to_return = False,
         update_search = False
     ) -> Artist | None:
-        """Fetches the artist from the database. Because we need to search by name and it needs to be
-        case insensitive, we are fetching all of them. I have no idea on how to search it otherwise.
+        """Fetches the artist from the in-memory artist index. Until the index is built,
+        the artist is fetched using the case insensitive database indexes instead.
+        Either way the lookup is case insensitive and also matches aliases.
 
         Parameters
         ----------
@@ -63,36 +94,27 @@ class Artists(commands.Cog):
         Union[Artist, None]
             The artist if found.
         """
-        artists: list[Artist] = []
-        async for document in ctx.bot.artists.find({}):
-            artists.append(Artist(document))
-
-        async def do_update(a):
-            await ctx.bot.artists.update_one(
-                {'name':a.name},
-                {'$set':{'searches':a.searches+1}}
-            )
+        index = ctx.bot.artist_index
+        if index.ready:
+            artist = index.get(name)
+        else:
+            if not index.loading:
+                self.bot.loop.create_task(index.load(ctx.bot.artists))
+            artist = await find_artist(ctx.bot.artists, name)
+            
+        if artist:
+            if update_search:
+                unique = ctx.bot.search_counter.add(artist, ctx.author.id)
+                artist = index.record_search(artist, unique)
+            return artist
 
-        for a in artists:
-            if a.name.casefold() == name.casefold():
-                if update_search:
-                    await do_update(a)
-                return a
+        if to_return:
+            matches = index.suggest(name)
+            if matches:
+                matches = ', '.join(f'"{m}"' for m in matches)
+                await ctx.send(f'Artist "{name}" not found. Did you mean {matches}?')
             else:
-                for alias in a.aliases:
-                    if alias.casefold() == name.casefold():
-                        if update_search:
-                            await do_update(a)
-                    return a
-            
-        else:
-            if to_return:
-                match = get_close_matches(name, [a.name for a in artists], 1)
-                if match:
-                    await ctx.send(f'Artist "{name}" not found. Did you mean "{match[0]}"?')
-                else:
-                    await ctx.send(f'Artist "{name}" not found.')
-            return
+                await ctx.send(f'Artist "{name}" not found.')
     
     @botchannel()
     @commands.group(name='artist', invoke_without_command=True)
@@ -101,7 +123,7 @@ class Artists(commands.Cog):
         artist = await self.get_artist(ctx, name, to_return=True, update_search=True)
         if not artist:
             return
-        await ctx.send(embed=artist.embed)
+        await ctx.send(embed=ctx.bot.artist_index.embed(artist))
         
     @admin()
     @artist.command(name='add')
@@ -109,7 +131,7 @@ class Artists(commands.Cog):
         """Adds an artist."""
         artist = await self.get_artist(ctx, flag.name)
         if artist:
-            return await ctx.send('Artist already exists!', embed=artist.embed)
+            return await ctx.send('Artist already exists!', embed=ctx.bot.artist_index.embed(artist))
         
         avatar = flag.avatar or ctx.guild.icon.url
         
@@ -127,11 +149,13 @@ class Artists(commands.Cog):
         }
         
         await ctx.bot.artists.insert_one(document)
+        artist = Artist(document)
+        ctx.bot.artist_index.add(artist)
         
         await ctx.tick(True)
         await ctx.send(
             'Artist added successfully!',
-            embed = Artist(document).embed
+            embed = ctx.bot.artist_index.embed(artist)
         )
         
     @admin()
@@ -143,6 +167,8 @@ class Artists(commands.Cog):
             return await ctx.send(f'Artist "{name}" does not exist in our database.')
         
         await self.bot.artists.delete_one({'name':artist.name})
+        self.bot.search_counter.discard(artist.name)
+        self.bot.artist_index.remove(artist.name)
         await ctx.tick(True)
         
     @admin()
@@ -175,18 +201,20 @@ class Artists(commands.Cog):
                 except ValueError:
                     pass
         
-        document = {
+        changes = {
             'name':flag.name or artist.name,
             'music':flag.music or artist.music,
             'release':flag.release or artist.release,
             'avatar':avatar,
-            'added':artist.added,
-            'searches':artist.searches,
-            'aliases':aliases
+            'aliases':tuple(aliases)
         }
         
-        await ctx.bot.artists.collection.replace_one({'name':artist.name}, document)
-        artist = Artist(document)
+        # only the edited fields are set so the search counters are left alone
+        await ctx.bot.artists.update_one({'name':artist.name}, {'$set':changes})
+        ctx.bot.search_counter.rename(artist.name, changes['name'])
+        ctx.bot.artist_index.remove(artist.name)
+        artist = artist.replace(**changes)
+        ctx.bot.artist_index.add(artist)
         embed = artist.embed
         embed.title = 'Artist Modified Succesfully'
         embed.colour = discord.Color.green()
@@ -199,44 +227,158 @@ class Artists(commands.Cog):
         await ctx.tick(True)
         await ctx.send(embed=embed)
         
+    @admin()
+    @artist.command(name='import')
+    async def importartists(self, ctx: Context):
+        """Imports artists from an attached `.jsonl` or `.csv` file.
+        
+        Each row needs a `name`, `music`, `release` and `avatar`. `added`, `searches`
+        and `aliases` (comma separated in a csv) are optional. Artists which already
+        exist, by name or alias, are skipped.
+        """
+        if not ctx.message.attachments:
+            return await ctx.send('Please attach a `.jsonl` or `.csv` file.')
+        
+        attachment = ctx.message.attachments[0]
+        format = attachment.filename.rsplit('.', 1)[-1].casefold()
+        if format == 'json':
+            format = 'jsonl'
+        if format not in ('jsonl', 'csv'):
+            return await ctx.send('Only `.jsonl` and `.csv` files can be imported.')
+        
+        index = ctx.bot.artist_index
+        if not index.ready:
+            await index.load(ctx.bot.artists)
+        
+        stream = io.TextIOWrapper(io.BytesIO(await attachment.read()), encoding='utf-8-sig', newline='')
+        seen: set[str] = set()
+        chunk: list[dict] = []
+        imported = skipped = 0
+        errors: list[str] = []
+        
+        async def insert(documents: list[dict]) -> int:
+            try:
+                await ctx.bot.artists.insert_many(documents, ordered=False)
+            except BulkWriteError as e:
+                failed = {error['index'] for error in e.details.get('writeErrors', [])}
+                documents = [d for i, d in enumerate(documents) if i not in failed]
+                errors.append(f'{len(failed)} artists failed to insert.')
+            for document in documents:
+                index.add(Artist(document))
+            return len(documents)
+        
+        try:
+            for number, row in enumerate(read_artist_rows(stream, format), 1):
+                try:
+                    document = artist_document(row)
+                except ValueError as e:
+                    errors.append(f'Row {number}: {e}')
+                    continue
+                
+                names = [document['name'], *document['aliases']]
+                if any(n.casefold() in seen or n in index for n in names):
+                    skipped += 1
+                    continue
+                seen.update(n.casefold() for n in names)
+                
+                chunk.append(document)
+                if len(chunk) >= IMPORT_CHUNK_SIZE:
+                    imported += await insert(chunk)
+                    chunk = []
+        except (UnicodeDecodeError, csv.Error) as e:
+            errors.append(f'Stopped reading the file: {e}')
+            
+        if chunk:
+            imported += await insert(chunk)
+            
+        message = f'Imported **{imported}** artists, skipped **{skipped}** which already exist.'
+        if errors:
+            shown = '\n'.join(errors[:10])
+            more = f'\n...and {len(errors) - 10} more.' if len(errors) > 10 else ''
+            message += f'\n**{len(errors)} errors:**\n{shown}{more}'
+            
+        await ctx.tick(bool(imported))
+        await ctx.send(message)
+        
+    @admin()
+    @artist.command(name='export')
+    async def exportartists(self, ctx: Context, format: str = 'jsonl'):
+        """Exports all artists as a `jsonl` (default) or `csv` file."""
+        format = format.casefold()
+        if format not in ('jsonl', 'csv'):
+            return await ctx.send('The format should either be `jsonl` or `csv`.')
+        
+        buffer = io.BytesIO()
+        stream = io.TextIOWrapper(buffer, encoding='utf-8', newline='')
+        writer = ArtistWriter(stream, format)
+        async for document in ctx.bot.artists.find({}, {'_id':False}).sort(ALL_ARTISTS_SORT):
+            writer.write(document)
+        stream.flush()
+        buffer = stream.detach()
+        buffer.seek(0)
+        
+        await ctx.send(
+            f'Exported **{writer.written}** artists.',
+            file=discord.File(buffer, filename=f'artists.{format}')
+        )
+        
     @botchannel()
     @artist.command(name='all')
     async def allartists(self, ctx: Context):
         """Shows all artists."""
         
-        artists: list[Artist] = []
-        async for document in ctx.bot.artists.find({}):
-            artists.append(Artist(document))
-            
-        artists.sort(key=lambda a: a.added)
-        
         try:
-            p = ArtistPages(artists)
+            p = ArtistPages(ctx.bot.artists, sort=ALL_ARTISTS_SORT, index=ctx.bot.artist_index)
+            await p.start(ctx)
         except menus.MenuError as e:
             await ctx.send(e)
-        else:
-            await p.start(ctx)
             
     @botchannel()
     @artist.command(name='popular')
-    async def popartists(self, ctx: Context):
-        """Shows artists based on most artist searches using the bot.
+    async def popartists(self, ctx: Context, by: str = 'searches'):
+        """Shows the 10 most searched artists using the bot.
+        
+        Use `unique` to rank the artists by the (estimated) amount of different
+        users who searched for them instead.
         
         This in no way represent the actual popularity of an artist and
         should not be used to compile any data for an artists popularity.
         """
-        artists: list[Artist] = []
-        async for document in ctx.bot.artists.find({}):
-            artists.append(Artist(document))
-            
-        artists.sort(key=lambda a: a.searches)
-        
+        unique = by.casefold() in ('unique', 'users')
         try:
-            p = ArtistPages(artists, show_searches=True)
+            p = ArtistPages(
+                ctx.bot.artists,
+                sort=UNIQUE_ARTISTS_SORT if unique else POPULAR_ARTISTS_SORT,
+                index=ctx.bot.artist_index,
+                limit=POPULAR_ARTISTS_LIMIT,
+                show_searches=not unique,
+                show_unique=unique
+            )
+            await p.start(ctx)
         except menus.MenuError as e:
             await ctx.send(e)
-        else:
-            await p.start(ctx)
+            
+    @botchannel()
+    @artist.command(name='trending')
+    async def trendingartists(self, ctx: Context, period: str = 'day'):
+        """Shows the most searched artists of the current `hour`, `day` (default) or `week`."""
+        period = period.casefold()
+        if period not in ('hour', 'day', 'week'):
+            return await ctx.send('The period should either be `hour`, `day` or `week`.')
+        
+        trending = await ctx.bot.search_counter.analytics.trending(period)
+        if not trending:
+            return await ctx.send(f'No artists have been searched for this {period} yet.')
+        
+        embed = Embed(
+            title = f'Trending Artists This {period.title()}',
+            description = '\n'.join(
+                f'{i}. **{name}** ({count} searches)' for i, (name, count) in enumerate(trending, 1)
+            ),
+            colour = ctx.bot.colour,
+            footer = ctx.bot.branding
+        )
+        await ctx.send(embed=embed)
             
     @botchannel()
     @artist.command(aliases=['repr'], hidden=True)
@@ -19,11 +19,13 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 from __future__ import annotations
 
 import discord
+import humanize
 import random
 
 from typing import Any
 from discord.ext import commands, tasks
 from utils.bot import Bot
+from utils.cache import registered_caches
 from utils.context import Context
 
 
@@ -70,6 +72,33 @@ class Config(commands.Cog, command_attrs=dict(hidden=True)):
                 return await ctx.send(self.error(e))
             await ctx.send(f'\U0001f501 `{name}`')
             
+    @commands.command()
+    @commands.is_owner()
+    async def cachestats(self, ctx: Context):
+        """Shows the hits, misses and evictions of every registered cache."""
+        rows = [('Name', 'Size', 'Hits', 'Misses', 'Rate', 'Expired', 'Evicted', 'Memory')]
+        for name, cache in registered_caches().items():
+            rate = cache.hit_rate
+            rows.append((
+                name,
+                f'{len(cache)}/{cache.maxsize}' if cache.maxsize else str(len(cache)),
+                str(cache.hits),
+                str(cache.misses),
+                f'{rate:.1%}' if rate is not None else '-',
+                str(cache.expired),
+                str(cache.evicted),
+                humanize.naturalsize(cache.memory_usage(), gnu=True)
+            ))
+            
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+        table = '\n'.join('  '.join(c.ljust(w) for c, w in zip(row, widths)).rstrip() for row in rows)
+        
+        dispatcher = self.bot.log_dispatcher
+        await ctx.send(
+            f'```\n{table}```'\
+            f'Log dispatcher: {dispatcher.depth} queued, {dispatcher.sent_embeds} sent, {dispatcher.dropped} dropped'
+        )
+            
             
     def status(self) -> discord.Status:
         return random.choice([
@@ -17,24 +17,109 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
 from __future__ import annotations
+import asyncio
 import discord
 import humanize
+import io
 import os
 
+from collections import Counter
 from typing import Optional
+from utils.audit import AuditLogTail
 from utils.bot import Bot
+from utils.context import Context
+from utils.flags import LogSearch
+from utils.messages import MessageStore, StoredMessage
+from utils.paginator import EventPages
+from utils.raids import JoinBurstDetector
 from utils.utils import human_time, Embed
-from discord.ext import commands
+from discord.ext import commands, menus, tasks
 
 class EventLogger(commands.Cog):
     def __init__(self, bot: Bot):
         self.bot = bot
+        self._guild_webhook: Optional[discord.Webhook] = None
+        self.audit_logs = AuditLogTail()
+        self.messages = MessageStore()
+        self.joins = JoinBurstDetector()
+        self._join_summaries: dict[int, asyncio.Task] = {}
+        self.compact_archive.start()
+        self.sweep_messages.start()
         
     async def on_ready(self) -> None:
         await self.bot.wait_until_ready()
         
+    def cog_unload(self) -> None:
+        self.compact_archive.cancel()
+        self.sweep_messages.cancel()
+        for task in self._join_summaries.values():
+            task.cancel()
+            
+    @tasks.loop(hours=24.0)
+    async def compact_archive(self) -> None:
+        try:
+            deleted = await self.bot.event_archive.compact()
+        except Exception as e:
+            print(f'Failed to compact the event archive: {e}')
+        else:
+            print(f'COMPACT: {deleted} archived events')
+            
+    @tasks.loop(minutes=10.0)
+    async def sweep_messages(self) -> None:
+        # guilds which went quiet would otherwise keep their messages until a new one comes in
+        self.messages.sweep()
+            
+    @compact_archive.before_loop
+    async def before_compact_archive(self) -> None:
+        await self.bot.wait_until_ready()
+        await self.bot.event_archive.start()
+        
+    def archive(
+        self,
+        guild_id: int,
+        embed: discord.Embed,
+        type: str,
+        *,
+        user_id: Optional[int] = None,
+        channel_id: Optional[int] = None
+    ) -> None:
+        """Records a logged embed in the event archive.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the guild the event happened in.
+        embed : discord.Embed
+            The embed which was logged.
+        type : str
+            The type of the event, e.g. `message_delete`.
+        user_id : Optional[int]
+            The ID of the user the event is about.
+        channel_id : Optional[int]
+            The ID of the channel the event happened in.
+        """
+        content = [embed.title or '']
+        if embed.description:
+            content.append(embed.description)
+        content.extend(f'{field.name}: {field.value}' for field in embed.fields)
+        self.bot.event_archive.record(guild_id, type, '\n'.join(content), user_id=user_id, channel_id=channel_id)
+        
+    def dispatch(
+        self,
+        channel: discord.TextChannel,
+        embed: discord.Embed,
+        type: str,
+        *,
+        user_id: Optional[int] = None,
+        channel_id: Optional[int] = None
+    ) -> None:
+        """Queues an embed to be sent to the log channel and archives it."""
+        self.bot.log_dispatcher.queue(channel, embed)
+        self.archive(channel.guild.id, embed, type, user_id=user_id, channel_id=channel_id)
+        
     async def check_log_channel(self, guild: discord.Guild) -> Optional[discord.TextChannel]:
-        """Checks if a log channel is set for the current guild or not.
+        """Checks if a log channel is set for the current guild or not. The channel is
+        cached by the bot's log channel resolver.
 
         Parameters
         ----------
@@ -46,102 +131,179 @@ class EventLogger(commands.Cog):
         Optional[discord.TextChannel]
             The channel if set or None.
         """
-        settings = await self.bot.settings.find_one({'guildId':guild.id})
-        if not settings:
-            return
-        
-        channel_id = settings.get('log')
-        if channel_id:
-            channel = guild.get_channel(channel_id)
-            if not channel:
-                channel = await guild.fetch_channel(channel_id)
-                
-            if isinstance(channel, discord.TextChannel):
-                return channel
-            else:
-                return
-        else:
+        return await self.bot.log_channels.get(guild)
+    
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
+        self.bot.log_channels.invalidate(channel.guild.id, channel.id)
+        self.bot.log_dispatcher.webhooks.invalidate(channel.id)
+    
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message):
+        if not message.guild or message.author.bot:
             return
+        if await self.check_log_channel(message.guild):
+            self.messages.add(message)
+    
+    def stored_message(
+        self,
+        guild_id: int,
+        message_id: int,
+        cached: Optional[discord.Message]
+    ) -> Optional[StoredMessage]:
+        """Takes a message out of the store, falling back to discord.py's cached message."""
+        stored = self.messages.pop(guild_id, message_id)
+        if stored is None and cached is not None and not cached.author.bot:
+            stored = StoredMessage(cached)
+        return stored
     
+    def stored_author(self, guild: discord.Guild, stored: StoredMessage) -> tuple[Optional[discord.Member], str]:
+        member = guild.get_member(stored.author_id)
+        return member, f'**Author:** <@{stored.author_id}> (ID: `{stored.author_id}`)\n'
     
     @commands.Cog.listener()
-    async def on_message_delete(self, message: discord.Message):
-        if message.author.bot:
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        if payload.guild_id is None:
             return
-        channel = await self.check_log_channel(message.guild)
+        stored = self.stored_message(payload.guild_id, payload.message_id, payload.cached_message)
+        if stored is None:
+            return
+        guild = self.bot.get_guild(payload.guild_id)
+        if guild is None:
+            return
+        channel = await self.check_log_channel(guild)
         if channel is None:
             return
         
+        member, author = self.stored_author(guild, stored)
         embed = Embed(
-            author = message.author,
+            author = member,
             colour = discord.Colour.red(),
             footer = 'Deleted At',
             title = 'Message Deleted',
-            description = f'**Channel:** {message.channel.mention}'
+            description = f'{author}**Channel:** <#{payload.channel_id}>'
         )
         
-        if message.content:
+        if stored.content:
             embed.add_field(
                 name = 'Content',
-                value = message.content,
+                value = stored.content,
                 inline = False
             )
             
-        if message.attachments:
+        if stored.attachments:
             embed.add_field(
                 name='Attachments',
-                value=', '.join(f'{a.filename} ({a.content_type})' for a in message.attachments)
+                value=', '.join(stored.attachments)
             )
             
-        await embed.send(channel)
+        self.dispatch(channel, embed, 'message_delete', user_id=stored.author_id, channel_id=payload.channel_id)
         
     @commands.Cog.listener()
-    async def on_bulk_message_delete(self, messages: list[discord.Message]):
-        
-        
-        deleted = [m for m in messages if len(m.content) <= 200]
-        description = '\n'.join(f'**[{m.author}]:** {m.content}' for m in deleted)
-        dummy = messages[0]
-        
-        channel = await self.check_log_channel(dummy.guild)
+    async def on_raw_bulk_message_delete(self, payload: discord.RawBulkMessageDeleteEvent):
+        if payload.guild_id is None:
+            return
+        cached = {m.id: m for m in payload.cached_messages}
+        stored = [self.stored_message(payload.guild_id, i, cached.get(i)) for i in payload.message_ids]
+        stored = [m for m in stored if m is not None]
+        if not stored:
+            return
+        guild = self.bot.get_guild(payload.guild_id)
+        if guild is None:
+            return
+        channel = await self.check_log_channel(guild)
         if not channel:
             return
         
-        if len(description) > 2048:
-            description = f'Too many messages to show. {len(messages)} messages were deleted'
+        authors: Counter[int] = Counter(m.author_id for m in stored)
+        description = '\n'.join(f'<@{author_id}>: {count}' for author_id, count in authors.most_common(10))
+        if len(authors) > 10:
+            description += f'\n...and {len(authors) - 10} more.'
         
+        deleted = len(payload.message_ids)
         embed = Embed(
             colour = discord.Colour.red(),
-            title = f'{len(messages)} messages deleted in #{dummy.channel}',
-            description = description,
-            footer = f'{len(deleted)} messages are shown.'
+            title = f'{deleted} messages deleted in #{guild.get_channel(payload.channel_id)}',
+            description = (
+                f'**Channel:** <#{payload.channel_id}>\n'\
+                f'**Authors:**\n{description}'
+            ),
+            footer = 'The full transcript is attached.'
+        )
+        if len(stored) < deleted:
+            embed.description += f'\n\n{deleted - len(stored)} of them were not stored, e.g. bot or older messages, and are not in the transcript.'
+        
+        transcript = self.write_transcript(guild, stored)
+        await self.bot.log_dispatcher.send(
+            channel,
+            embed,
+            data=transcript.getvalue(),
+            filename=f'transcript-{payload.channel_id}.txt'
         )
+        self.archive(guild.id, embed, 'bulk_delete', channel_id=payload.channel_id)
         
-        await embed.send(channel)
+    def write_transcript(self, guild: discord.Guild, messages: list[StoredMessage]) -> io.BytesIO:
+        """Writes the deleted messages, oldest first, into an in-memory text file.
+
+        Parameters
+        ----------
+        guild : discord.Guild
+            The guild the messages were deleted in, used to look up their authors.
+        messages : list[StoredMessage]
+            The deleted messages.
+
+        Returns
+        -------
+        io.BytesIO
+            The transcript, ready to be read.
+        """
+        buffer = io.BytesIO()
+        stream = io.TextIOWrapper(buffer, encoding='utf-8')
+        for m in sorted(messages, key=lambda m: m.id):
+            created_at = discord.utils.snowflake_time(m.id)
+            author = guild.get_member(m.author_id) or 'Unknown Member'
+            stream.write(f'[{created_at:%Y-%m-%d %H:%M:%S} UTC] {author} ({m.author_id}): {m.content}\n')
+            for filename in m.attachments:
+                stream.write(f'    Attachment: {filename}\n')
+        stream.flush()
+        buffer = stream.detach()
+        buffer.seek(0)
+        return buffer
         
     @commands.Cog.listener()
-    async def on_message_edit(self, before: discord.Message, after: discord.Message):
-        if not before.guild:
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
+        # embeds loading in also fire this, without any content
+        if 'content' not in payload.data or 'guild_id' not in payload.data:
             return
-        if before.author.bot:
+        guild = self.bot.get_guild(int(payload.data['guild_id']))
+        if guild is None:
             return
-        channel = await self.check_log_channel(before.guild)
+        channel = await self.check_log_channel(guild)
         if not channel:
             return
         
-        if before.content != after.content:
-            embed = Embed(
-                author = before.author,
-                colour = discord.Colour.blue(),
-                footer = 'Modified At',
-                title = 'Message Edited',
-                description = f'**Channel:** {before.channel.mention}'
-            )
-            
-            embed.add_field(name='Before', value=before.content, inline=False)
-            embed.add_field(name='After', value=after.content, inline=False)
-            
-            await embed.send(channel)
+        stored = self.messages.get(guild.id, payload.message_id)
+        cached = payload.cached_message
+        if stored is None and cached is not None and not cached.author.bot:
+            self.messages.add(cached)
+            stored = self.messages.get(guild.id, cached.id)
+        if stored is None or stored.content == payload.data['content']:
+            return
+        before, stored.content = stored.content, payload.data['content']
+        
+        member, author = self.stored_author(guild, stored)
+        embed = Embed(
+            author = member,
+            colour = discord.Colour.blue(),
+            footer = 'Modified At',
+            title = 'Message Edited',
+            description = f'{author}**Channel:** <#{payload.channel_id}>'
+        )
+        
+        embed.add_field(name='Before', value=before or '\u200b', inline=False)
+        embed.add_field(name='After', value=stored.content or '\u200b', inline=False)
+        
+        self.dispatch(channel, embed, 'message_edit', user_id=stored.author_id, channel_id=payload.channel_id)
             
     @commands.Cog.listener()
     async def on_member_join(self, member: discord.Member):
@@ -149,6 +311,11 @@ class EventLogger(commands.Cog):
         if not channel:
             return
         
+        if self.joins.add(member):
+            if member.guild.id not in self._join_summaries:
+                self._join_summaries[member.guild.id] = self.bot.loop.create_task(self.summarize_joins(member.guild))
+            return
+        
         new = ''
         if member.created_at.day < 3:
             new = '\N{WARNING SIGN} **New Member:** '
@@ -159,12 +326,54 @@ class EventLogger(commands.Cog):
             author = member,
             title = 'Member Joined',
             description = (
-                f'{member.mention} {humanize.intcomma(humanize.ordinal(len(member.guild.members)))} to join.\n'\
+                f'{member.mention} {humanize.intcomma(humanize.ordinal(member.guild.member_count))} to join.\n'\
                 f'{new}created {humanize.naturaltime(member.created_at, when=discord.utils.utcnow())}.'
             )
         )
         
-        await embed.send(channel)
+        self.dispatch(channel, embed, 'member_join', user_id=member.id)
+        
+    async def summarize_joins(self, guild: discord.Guild) -> None:
+        """Logs the members who joined during a burst, one embed per window, until it ends.
+
+        Parameters
+        ----------
+        guild : discord.Guild
+            The guild the burst is in.
+        """
+        try:
+            while True:
+                await asyncio.sleep(self.joins.window)
+                members = self.joins.take(guild.id)
+                if not members:
+                    break
+                channel = await self.check_log_channel(guild)
+                if channel:
+                    self.dispatch(channel, self.join_summary(guild, members), 'member_join_burst')
+        finally:
+            self._join_summaries.pop(guild.id, None)
+            
+    def join_summary(self, guild: discord.Guild, members: list[discord.Member]) -> Embed:
+        now = discord.utils.utcnow()
+        lines = []
+        length = 0
+        for member in members:
+            line = f'{member.mention} (`{member.id}`) created {humanize.naturaltime(member.created_at, when=now)}'
+            length += len(line) + 1
+            if length > 3900:
+                lines.append(f'...and {len(members) - len(lines)} more.')
+                break
+            lines.append(line)
+            
+        return Embed(
+            colour = discord.Colour.orange(),
+            footer = f'Member Count: {guild.member_count}',
+            title = f'\N{WARNING SIGN} {len(members)} Members Joined',
+            description = (
+                f'**Possible raid:** {len(members)} members joined in the last '\
+                f'{humanize.naturaldelta(self.joins.window)}.\n\n' + '\n'.join(lines)
+            )
+        )
         
     @commands.Cog.listener()
     async def on_member_remove(self, member: discord.Member):
@@ -189,7 +398,7 @@ class EventLogger(commands.Cog):
         if roles:
             embed.add_field(name='Roles', value=', '.join(r.mention for r in roles))
             
-        await embed.send(channel)
+        self.dispatch(channel, embed, 'member_remove', user_id=member.id)
         
     @commands.Cog.listener()
     async def on_member_update(self, before: discord.Member, after: discord.Member):
@@ -212,7 +421,7 @@ class EventLogger(commands.Cog):
                 )
             )
             
-            await embed.send(channel)
+            self.dispatch(channel, embed, 'nickname_update', user_id=after.id)
             
         if before.roles != after.roles:
             embed = Embed(
@@ -246,8 +455,16 @@ class EventLogger(commands.Cog):
                     inline = False
                 )
                 
-            await embed.send(channel)
+            self.dispatch(channel, embed, 'roles_update', user_id=after.id)
             
+    def moderation_reason(self, entry: Optional[discord.AuditLogEntry]) -> str:
+        if entry is None:
+            return 'Could not find this in the audit logs.'
+        return (
+            f'**Reason:** {entry.reason if entry.reason else "No reason was provided."}\n'\
+            f'**Moderator:** {entry.user.mention} (ID: `{entry.user.id}`)'
+        )
+        
     @commands.Cog.listener()
     async def on_member_ban(self, guild: discord.Guild, user: discord.Member | discord.User):
         if not guild.me.guild_permissions.view_audit_log:
@@ -257,13 +474,7 @@ class EventLogger(commands.Cog):
         if not channel:
             return
         
-        async for entry in guild.audit_logs(action=discord.AuditLogAction.ban):
-            if entry.target.id == user.id:
-                reason = (
-                    f'**Reason:** {entry.reason if entry.reason else "No reason was provided."}\n'\
-                    f'**Moderator:** {entry.user.mention} (ID: `{entry.user.id}`)'
-                )
-                break
+        reason = self.moderation_reason(await self.audit_logs.find(guild, discord.AuditLogAction.ban, user.id))
             
         embed = Embed(
             title = 'Member Banned',
@@ -272,7 +483,7 @@ class EventLogger(commands.Cog):
             author = user
         )
             
-        await embed.send(channel)
+        self.dispatch(channel, embed, 'ban', user_id=user.id)
         
     @commands.Cog.listener()
     async def on_member_unban(self, guild: discord.Guild, user: discord.User):
@@ -283,13 +494,7 @@ class EventLogger(commands.Cog):
         if not channel:
             return
         
-        async for entry in guild.audit_logs(action=discord.AuditLogAction.unban):
-            if entry.target.id == user.id:
-                reason = (
-                    f'**Reason:** {entry.reason if entry.reason else "No reason was provided."}\n'\
-                    f'**Moderator:** {entry.user.mention} (ID: `{entry.user.id}`)'
-                )
-                break
+        reason = self.moderation_reason(await self.audit_logs.find(guild, discord.AuditLogAction.unban, user.id))
             
         embed = Embed(
             title = 'Member Unbanned',
@@ -298,7 +503,34 @@ class EventLogger(commands.Cog):
             author = user
         )
             
-        await embed.send(channel)
+        self.dispatch(channel, embed, 'unban', user_id=user.id)
+    
+    @commands.has_guild_permissions(manage_guild=True)
+    @commands.group(invoke_without_command=True)
+    async def logs(self, ctx: Context):
+        """Commands for the archive of this guild's logs."""
+        await ctx.send_help(ctx.command)
+        
+    @commands.has_guild_permissions(manage_guild=True)
+    @logs.command(name='search')
+    async def logs_search(self, ctx: Context, *, flags: LogSearch):
+        """Searches the logged events of this guild, newest first.
+        
+        All the flags are optional: `user:` the user the event is about, `channel:` the
+        channel it happened in and `type:` the kind of event, e.g. `message_edit`.
+        """
+        try:
+            p = EventPages(
+                ctx.bot.event_archive,
+                ctx.guild.id,
+                user_id=flags.user.id if flags.user else None,
+                channel_id=flags.channel.id if flags.channel else None,
+                type=flags.type.casefold() if flags.type else None
+            )
+        except menus.MenuError as e:
+            await ctx.send(e)
+        else:
+            await p.start(ctx)
     
     async def guild_logger(self, guild: discord.Guild, event: str):
         if event.casefold() == 'remove':
@@ -323,12 +555,16 @@ class EventLogger(commands.Cog):
         if guild.icon:
             embed.set_thumbnail(url=guild.icon.url)
             
-        webhook = discord.Webhook.from_url(url=os.getenv('DSCN_LOGGER'), session=self.bot.session)
-        await webhook.send(embed=embed)
+        if self._guild_webhook is None:
+            self._guild_webhook = discord.Webhook.from_url(url=os.getenv('DSCN_LOGGER'), session=self.bot.session)
+        await self._guild_webhook.send(embed=embed)
     
     @commands.Cog.listener()
     async def on_guild_remove(self, guild: discord.Guild):
         await self.bot.settings.delete_one({'guildId':guild.id})
+        self.bot.settings_cache.invalidate(guild.id)
+        self.messages.clear(guild.id)
+        self.joins.clear(guild.id)
         await self.guild_logger(guild, 'remove')
         
     @commands.Cog.listener()
@@ -30,7 +30,7 @@ from discord.ext import commands, tasks
 from utils.bot import Bot
 from utils.cache import ExpiringCache
 
-cache = ExpiringCache(seconds=7200)
+cache = ExpiringCache(seconds=7200, name='tech_news')
 class News:
     def __init__(self, data: dict):
         source: dict = data['source']
@@ -0,0 +1,194 @@
+"""
+Artist search analytics
+Copyright (C) 2021  ItsArtemiz (Augadh Verma)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from __future__ import annotations
+
+import discord
+
+from collections import Counter
+from datetime import datetime, timedelta
+from pymongo import ASCENDING, DESCENDING, IndexModel, UpdateOne
+from pymongo.errors import BulkWriteError
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from utils.bot import Bot
+
+# How long the bucket of each period is kept for. Week buckets are kept forever.
+RETENTION = {
+    'hour':timedelta(days=7),
+    'day':timedelta(days=90),
+    'week':None
+}
+
+SEARCH_STATS_INDEXES = [
+    IndexModel([('period', ASCENDING), ('start', ASCENDING), ('artist', ASCENDING)], name='bucket', unique=True),
+    IndexModel([('period', ASCENDING), ('start', ASCENDING), ('count', DESCENDING)], name='trending'),
+    IndexModel([('expires', ASCENDING)], name='expires', expireAfterSeconds=0)
+]
+
+def bucket_start(when: datetime, period: str) -> datetime:
+    """The start of the bucket of a period which a time falls in.
+
+    Parameters
+    ----------
+    when : datetime
+        The time, in UTC.
+    period : str
+        One of `hour`, `day` or `week`. Weeks start on monday.
+
+    Returns
+    -------
+    datetime
+        The start of the bucket.
+    """
+    start = when.replace(minute=0, second=0, microsecond=0)
+    if period == 'hour':
+        return start
+    start = start.replace(hour=0)
+    if period == 'day':
+        return start
+    return start - timedelta(days=start.weekday())
+
+class SearchAnalytics:
+    def __init__(self, bot: Bot):
+        """Counts artist searches into hourly, daily and weekly buckets.
+
+        The searches are collected in memory and each bucket is written with a single
+        `$inc` upsert on :meth:`flush`, so the daily and weekly rollups are always up
+        to date and trends are read without going through every search.
+
+        Parameters
+        ----------
+        bot : Bot
+            The bot, used to access the `ArtistSearches` collection.
+        """
+        self.bot = bot
+        self._pending: Counter[tuple[str, datetime]] = Counter()
+        # buckets whose upsert failed, by period, start and artist
+        self._failed: Counter[tuple[str, datetime, str]] = Counter()
+
+    def record(self, name: str, when: Optional[datetime] = None) -> None:
+        """Counts a search for an artist.
+
+        Parameters
+        ----------
+        name : str
+            The name of the artist.
+        when : Optional[datetime]
+            When the search happened, by default now.
+        """
+        when = when or discord.utils.utcnow()
+        self._pending[name, bucket_start(when, 'hour')] += 1
+
+    def rename(self, old: str, new: str) -> None:
+        """Moves the pending searches of a renamed artist.
+
+        Parameters
+        ----------
+        old : str
+            The old name of the artist.
+        new : str
+            The new name of the artist.
+        """
+        for (name, hour) in [k for k in self._pending if k[0] == old]:
+            self._pending[new, hour] += self._pending.pop((name, hour))
+        for (period, start, name) in [k for k in self._failed if k[2] == old]:
+            self._failed[period, start, new] += self._failed.pop((period, start, name))
+
+    def discard(self, name: str) -> None:
+        """Drops the pending searches of a deleted artist.
+
+        Parameters
+        ----------
+        name : str
+            The name of the artist.
+        """
+        for key in [k for k in self._pending if k[0] == name]:
+            del self._pending[key]
+        for key in [k for k in self._failed if k[2] == name]:
+            del self._failed[key]
+
+    async def flush(self) -> int:
+        """Writes the pending searches into their buckets as one unordered bulk write.
+
+        If the write fails the buckets are kept so that the next flush retries them.
+        Only the buckets listed as failed in a :class:`BulkWriteError` are kept, since
+        the others have already been written.
+
+        Returns
+        -------
+        int
+            The amount of buckets updated.
+        """
+        if not self._pending and not self._failed:
+            return 0
+
+        pending, self._pending = self._pending, Counter()
+        buckets, self._failed = self._failed, Counter()
+        for (name, hour), count in pending.items():
+            for period in RETENTION:
+                buckets[period, bucket_start(hour, period), name] += count
+
+        keys = list(buckets)
+        requests = []
+        for (period, start, name) in keys:
+            count = buckets[period, start, name]
+            update = {'$inc':{'count':count}}
+            if RETENTION[period] is not None:
+                update['$setOnInsert'] = {'expires':start + RETENTION[period]}
+            requests.append(UpdateOne(
+                {'period':period, 'start':start, 'artist':name},
+                update,
+                upsert=True
+            ))
+
+        try:
+            await self.bot.search_stats.bulk_write(requests, ordered=False)
+        except BulkWriteError as e:
+            # the other buckets were written, retrying them would count them twice
+            for error in e.details.get('writeErrors', []):
+                key = keys[error['index']]
+                self._failed[key] += buckets[key]
+            raise
+        except Exception:
+            self._failed.update(buckets)
+            raise
+        return len(requests)
+
+    async def trending(self, period: str = 'day', limit: int = 10) -> list[tuple[str, int]]:
+        """The most searched artists of the current bucket of a period.
+
+        Parameters
+        ----------
+        period : Optional[str]
+            One of `hour`, `day` or `week`, by default `day`.
+        limit : Optional[int]
+            The amount of artists, by default `10`.
+
+        Returns
+        -------
+        list[tuple[str, int]]
+            The names of the artists and their searches, most searched first.
+        """
+        start = bucket_start(discord.utils.utcnow(), period)
+        cursor = self.bot.search_stats.find(
+            {'period':period, 'start':start},
+            {'_id':False, 'artist':True, 'count':True}
+        ).sort('count', DESCENDING).limit(limit)
+        return [(document['artist'], document['count']) async for document in cursor]
@@ -0,0 +1,308 @@
+"""
+Local event log archive
+Copyright (C) 2021  ItsArtemiz (Augadh Verma)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import sqlite3
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Any, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    guild_id INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    user_id INTEGER,
+    channel_id INTEGER,
+    content TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_guild ON events (guild_id, created_at);
+CREATE INDEX IF NOT EXISTS events_user ON events (guild_id, user_id, created_at);
+CREATE INDEX IF NOT EXISTS events_channel ON events (guild_id, channel_id, created_at);
+CREATE INDEX IF NOT EXISTS events_type ON events (guild_id, type, created_at);
+CREATE INDEX IF NOT EXISTS events_created_at ON events (created_at);
+"""
+
+_Event = tuple[int, str, Optional[int], Optional[int], str, float]
+
+class ArchivedEvent:
+    """An event read back from the archive."""
+    __slots__ = ('id', 'guild_id', 'type', 'user_id', 'channel_id', 'content', 'created_at')
+
+    def __init__(self, row: sqlite3.Row):
+        self.id: int = row['id']
+        self.guild_id: int = row['guild_id']
+        self.type: str = row['type']
+        self.user_id: Optional[int] = row['user_id']
+        self.channel_id: Optional[int] = row['channel_id']
+        self.content: str = row['content']
+        self.created_at: float = row['created_at']
+
+    def __repr__(self) -> str:
+        return f'<ArchivedEvent id={self.id} guild_id={self.guild_id} type={self.type!r}>'
+
+class EventArchive:
+    def __init__(
+        self,
+        path: str,
+        *,
+        batch_size: int = 200,
+        delay: float = 5.0,
+        max_queue: int = 10000,
+        retention: timedelta = timedelta(days=90)
+    ):
+        """An append-only SQLite archive of the logged events of every guild.
+
+        Events are put on a queue by :meth:`record` and written in batches by a
+        background task, on a single database thread, so logging an event never
+        waits on the disk. The database runs in WAL mode so searches don't block
+        the writes. The writer only waits for more events when there is less than a
+        batch queued, so a backlog is written as fast as the disk allows.
+
+        Parameters
+        ----------
+        path : str
+            The path of the database file.
+        batch_size : Optional[int]
+            The maximum amount of events written at once, by default `200`.
+        delay : Optional[float]
+            The seconds to wait for more events before writing, by default `5.0`.
+        max_queue : Optional[int]
+            The maximum amount of events waiting to be written, by default `10000`.
+            Events recorded while it is full are dropped.
+        retention : Optional[timedelta]
+            How long events are kept for by :meth:`compact`, by default 90 days.
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.delay = delay
+        self.retention = retention
+        self.dropped = 0
+        self._queue: asyncio.Queue[_Event] = asyncio.Queue(maxsize=max_queue)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='event-archive')
+        self._connection: Optional[sqlite3.Connection] = None
+        self._writer: Optional[asyncio.Task] = None
+        self._batch: list[_Event] = []
+        self._starting = asyncio.Lock()
+
+    async def _run(self, func, *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _connect(self) -> None:
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.row_factory = sqlite3.Row
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.executescript(SCHEMA)
+        self._connection = connection
+
+    async def start(self) -> None:
+        """Opens the database and starts writing the recorded events.
+
+        Does nothing if the archive has already been started.
+        """
+        async with self._starting:
+            if self._connection is None:
+                await self._run(self._connect)
+            if self._writer is None:
+                self._writer = asyncio.get_running_loop().create_task(self._write_loop())
+
+    def record(
+        self,
+        guild_id: int,
+        type: str,
+        content: str,
+        *,
+        user_id: Optional[int] = None,
+        channel_id: Optional[int] = None
+    ) -> None:
+        """Queues an event to be archived.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the guild the event happened in.
+        type : str
+            The type of the event, e.g. `message_delete`.
+        content : str
+            The text of the event, as it was logged.
+        user_id : Optional[int]
+            The ID of the user the event is about.
+        channel_id : Optional[int]
+            The ID of the channel the event happened in.
+        """
+        try:
+            self._queue.put_nowait((guild_id, type, user_id, channel_id, content, time.time()))
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def _insert(self, events: list[_Event]) -> None:
+        with self._connection:
+            self._connection.executemany(
+                'INSERT INTO events (guild_id, type, user_id, channel_id, content, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                events
+            )
+
+    def _take(self, limit: Optional[int] = None) -> list[_Event]:
+        limit = self.batch_size if limit is None else limit
+        events = []
+        while len(events) < limit and not self._queue.empty():
+            events.append(self._queue.get_nowait())
+        return events
+
+    async def _write_loop(self) -> None:
+        while True:
+            self._batch.append(await self._queue.get())
+            if self._queue.qsize() + 1 < self.batch_size:
+                # wait for a fuller batch, unless there is a backlog to catch up on
+                await asyncio.sleep(self.delay)
+            self._batch.extend(self._take(self.batch_size - len(self._batch)))
+            events, self._batch = self._batch, []
+            try:
+                # shielded so that closing doesn't cancel a batch the database thread already has
+                await asyncio.shield(self._run(self._insert, events))
+            except sqlite3.Error as e:
+                self.dropped += len(events)
+                print(f'Failed to archive {len(events)} events: {e}')
+
+    def _where(
+        self,
+        guild_id: int,
+        user_id: Optional[int],
+        channel_id: Optional[int],
+        type: Optional[str]
+    ) -> tuple[str, list]:
+        clauses = ['guild_id = ?']
+        params: list = [guild_id]
+        for column, value in (('user_id', user_id), ('channel_id', channel_id), ('type', type)):
+            if value is not None:
+                clauses.append(f'{column} = ?')
+                params.append(value)
+        return ' AND '.join(clauses), params
+
+    def _count(self, where: str, params: list) -> int:
+        return self._connection.execute(f'SELECT COUNT(*) FROM events WHERE {where}', params).fetchone()[0]
+
+    def _search(self, where: str, params: list, limit: int, offset: int) -> list[ArchivedEvent]:
+        rows = self._connection.execute(
+            f'SELECT * FROM events WHERE {where} ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?',
+            [*params, limit, offset]
+        )
+        return [ArchivedEvent(row) for row in rows]
+
+    async def count(
+        self,
+        guild_id: int,
+        *,
+        user_id: Optional[int] = None,
+        channel_id: Optional[int] = None,
+        type: Optional[str] = None
+    ) -> int:
+        """Counts the archived events of a guild matching the filters.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the guild.
+        user_id : Optional[int]
+            Only count the events about this user.
+        channel_id : Optional[int]
+            Only count the events in this channel.
+        type : Optional[str]
+            Only count the events of this type.
+
+        Returns
+        -------
+        int
+            The amount of events.
+        """
+        await self.start()
+        return await self._run(self._count, *self._where(guild_id, user_id, channel_id, type))
+
+    async def search(
+        self,
+        guild_id: int,
+        *,
+        user_id: Optional[int] = None,
+        channel_id: Optional[int] = None,
+        type: Optional[str] = None,
+        limit: int = 10,
+        offset: int = 0
+    ) -> list[ArchivedEvent]:
+        """Finds the archived events of a guild matching the filters, newest first.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the guild.
+        user_id : Optional[int]
+            Only find the events about this user.
+        channel_id : Optional[int]
+            Only find the events in this channel.
+        type : Optional[str]
+            Only find the events of this type.
+        limit : Optional[int]
+            The maximum amount of events, by default `10`.
+        offset : Optional[int]
+            The amount of events to skip, by default `0`.
+
+        Returns
+        -------
+        list[ArchivedEvent]
+            The events.
+        """
+        await self.start()
+        where, params = self._where(guild_id, user_id, channel_id, type)
+        return await self._run(self._search, where, params, limit, offset)
+
+    def _compact(self, cutoff: float) -> int:
+        with self._connection:
+            deleted = self._connection.execute('DELETE FROM events WHERE created_at < ?', (cutoff,)).rowcount
+        self._connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        return deleted
+
+    async def compact(self) -> int:
+        """Deletes the events older than the retention and shrinks the write-ahead log.
+
+        Returns
+        -------
+        int
+            The amount of events deleted.
+        """
+        await self.start()
+        return await self._run(self._compact, time.time() - self.retention.total_seconds())
+
+    async def close(self) -> None:
+        """Writes everything still queued and closes the database."""
+        if self._writer is not None:
+            self._writer.cancel()
+            self._writer = None
+        if self._connection is None:
+            return
+        events, self._batch = self._batch + self._take(), []
+        while events:
+            await self._run(self._insert, events)
+            events = self._take()
+        await self._run(self._connection.close)
+        self._connection = None
@@ -0,0 +1,637 @@
+"""
+In-memory artist lookups
+Copyright (C) 2021  ItsArtemiz (Augadh Verma)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import csv
+import discord
+import json
+
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from difflib import get_close_matches
+from pymongo import ASCENDING, DESCENDING, IndexModel, UpdateOne
+from pymongo.collation import Collation, CollationStrength
+from pymongo.errors import BulkWriteError
+from typing import IO, TYPE_CHECKING, Iterator, Optional
+
+from utils.analytics import SearchAnalytics
+from utils.cache import ExpiringCache
+from utils.db import Client
+from utils.hyperloglog import HyperLogLog
+from utils.utils import Artist
+
+if TYPE_CHECKING:
+    from utils.bot import Bot
+
+# Compares strings ignoring case, like `str.casefold` does for the in-memory index.
+ARTIST_COLLATION = Collation(locale='en', strength=CollationStrength.SECONDARY)
+
+ARTIST_INDEXES = [
+    IndexModel([('name', ASCENDING)], name='name_ci', collation=ARTIST_COLLATION),
+    IndexModel([('aliases', ASCENDING)], name='aliases_ci', collation=ARTIST_COLLATION),
+    IndexModel([('searches', DESCENDING), ('_id', ASCENDING)], name='searches'),
+    IndexModel([('uniqueSearches', DESCENDING), ('_id', ASCENDING)], name='unique_searches'),
+    IndexModel([('added', ASCENDING), ('_id', ASCENDING)], name='added')
+]
+
+# The sorts match an index above and end with `_id` so that pages are stable.
+ALL_ARTISTS_SORT = [('added', ASCENDING), ('_id', ASCENDING)]
+POPULAR_ARTISTS_SORT = [('searches', DESCENDING), ('_id', ASCENDING)]
+UNIQUE_ARTISTS_SORT = [('uniqueSearches', DESCENDING), ('_id', ASCENDING)]
+POPULAR_ARTISTS_LIMIT = 10
+
+# The fields needed to show an artist in the paginator.
+ARTIST_PAGE_PROJECTION = {
+    '_id':False,
+    'name':True,
+    'music':True,
+    'release':True,
+    'avatar':True,
+    'added':True,
+    'searches':True,
+    'uniqueSearches':True
+}
+
+# The fields written by `artist export` and read by `artist import`, in order.
+ARTIST_EXPORT_FIELDS = ('name', 'music', 'release', 'avatar', 'added', 'searches', 'aliases')
+
+def read_artist_rows(stream: IO[str], format: str) -> Iterator[dict]:
+    """Reads the rows of an artist import one at a time.
+
+    Parameters
+    ----------
+    stream : IO[str]
+        The text stream to read from.
+    format : str
+        Either `jsonl` (one JSON object per line) or `csv` (with a header row).
+
+    Yields
+    ------
+    dict
+        The raw rows, or an empty dict for a line which is not a JSON object.
+    """
+    if format == 'csv':
+        yield from csv.DictReader(stream)
+        return
+
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = {}
+        yield row if isinstance(row, dict) else {}
+
+def artist_document(row: dict) -> dict:
+    """Validates an imported row and turns it into an artist document.
+
+    Parameters
+    ----------
+    row : dict
+        The raw row read by :func:`read_artist_rows`.
+
+    Returns
+    -------
+    dict
+        The document to insert.
+
+    Raises
+    ------
+    ValueError
+        The row is missing a field or has an invalid value.
+    """
+    document = {}
+    for field in ('name', 'music', 'release', 'avatar'):
+        value = row.get(field)
+        if not isinstance(value, str) or not value.strip():
+            raise ValueError(f'missing "{field}"')
+        document[field] = value.strip()
+
+    if not document['avatar'].startswith('http'):
+        raise ValueError('"avatar" should start with "http(s)"')
+
+    added = row.get('added')
+    if added:
+        try:
+            added = datetime.fromisoformat(added)
+        except (TypeError, ValueError):
+            raise ValueError('"added" should be an ISO 8601 date')
+        if added.tzinfo is None:
+            added = added.replace(tzinfo=timezone.utc)
+    document['added'] = added or discord.utils.utcnow()
+
+    try:
+        document['searches'] = int(row.get('searches') or 0)
+    except (TypeError, ValueError):
+        raise ValueError('"searches" should be a number')
+
+    aliases = row.get('aliases') or []
+    if isinstance(aliases, str):
+        aliases = aliases.split(',')
+    document['aliases'] = [a.strip() for a in aliases if isinstance(a, str) and a.strip()]
+    return document
+
+class ArtistWriter:
+    def __init__(self, stream: IO[str], format: str):
+        """Writes artists for an export, one at a time, so :func:`read_artist_rows` can read them back.
+
+        Parameters
+        ----------
+        stream : IO[str]
+            The text stream to write to.
+        format : str
+            Either `jsonl` or `csv`.
+        """
+        self.stream = stream
+        self.format = format
+        self.written = 0
+        self._csv = None
+        if format == 'csv':
+            self._csv = csv.DictWriter(stream, ARTIST_EXPORT_FIELDS, extrasaction='ignore')
+            self._csv.writeheader()
+
+    def write(self, document: dict) -> None:
+        """Writes an artist.
+
+        Parameters
+        ----------
+        document : dict
+            The artist document.
+        """
+        row = {field: document.get(field) for field in ARTIST_EXPORT_FIELDS}
+        if isinstance(row['added'], datetime):
+            row['added'] = row['added'].isoformat()
+        row['aliases'] = row['aliases'] or []
+
+        if self._csv:
+            row['aliases'] = ','.join(row['aliases'])
+            self._csv.writerow(row)
+        else:
+            self.stream.write(json.dumps(row) + '\n')
+        self.written += 1
+
+async def find_artist(client: Client, name: str) -> Optional[Artist]:
+    """Finds an artist by its name or one of its aliases using the case insensitive indexes.
+
+    Used while the in-memory index is not built yet.
+
+    Parameters
+    ----------
+    client : Client
+        The client of the `Artists` collection.
+    name : str
+        The name or alias to search for, case insensitive.
+
+    Returns
+    -------
+    Optional[Artist]
+        The artist if found.
+    """
+    document = await client.find_one(
+        {'$or':[{'name':name}, {'aliases':name}]},
+        collation=ARTIST_COLLATION
+    )
+    if document:
+        return Artist(document)
+
+def trigrams(term: str) -> set[str]:
+    """Splits a term into its trigrams, padded so that short terms have some too.
+
+    Parameters
+    ----------
+    term : str
+        The term to split, should already be casefolded.
+
+    Returns
+    -------
+    set[str]
+        The trigrams of the term.
+    """
+    padded = f'  {term} '
+    return {padded[i:i+3] for i in range(len(padded) - 2)}
+
+class EmbedCache:
+    def __init__(self, *, maxsize: int = 256):
+        """An LRU cache of rendered artist embeds, keyed by artist and version.
+
+        The cached embeds are shared, so they should not be modified.
+
+        Parameters
+        ----------
+        maxsize : Optional[int]
+            The maximum amount of embeds to keep, by default `256`.
+        """
+        self.maxsize = maxsize
+        self._cache = ExpiringCache(None, maxsize=maxsize, name='artist_embeds')
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def get(self, artist: Artist, version: int) -> discord.Embed:
+        """Gets the embed of an artist, rendering it if it isn't cached for this version.
+
+        Parameters
+        ----------
+        artist : Artist
+            The artist to render.
+        version : int
+            The version of the artist, bumped on every modification.
+
+        Returns
+        -------
+        discord.Embed
+            The rendered embed.
+        """
+        key = artist.name.casefold()
+        cached = self._cache.peek(key)
+        if cached is not None and cached[0][0] == version:
+            return self._cache[key][0][1]
+
+        # an embed of an older version is a miss too
+        self._cache.misses += 1
+        embed = artist.embed
+        self._cache[key] = (version, embed)
+        return embed
+
+    def evict(self, name: str) -> None:
+        """Removes the embed of an artist.
+
+        Parameters
+        ----------
+        name : str
+            The name of the artist, case insensitive.
+        """
+        self._cache.pop(name.casefold(), None)
+
+    def clear(self) -> None:
+        """Removes every embed."""
+        self._cache.clear()
+
+class ArtistIndex:
+    def __init__(self):
+        """A case insensitive index of every artist, by name and by alias.
+
+        Names take priority over aliases, so an alias can never shadow the name
+        of another artist. Names and aliases are also indexed by trigram to
+        suggest artists when a lookup misses.
+        """
+        self._artists: dict[str, Artist] = {}
+        self._aliases: dict[str, str] = {}
+        self._grams: defaultdict[str, set[str]] = defaultdict(set)
+        self._versions: dict[str, int] = {}
+        self._version = 0
+        self.embeds = EmbedCache()
+        self._lock = asyncio.Lock()
+        self.ready = False
+
+    def __len__(self) -> int:
+        return len(self._artists)
+
+    @property
+    def loading(self) -> bool:
+        """Whether the index is being built right now."""
+        return self._lock.locked()
+
+    def __iter__(self) -> Iterator[Artist]:
+        return iter(self._artists.values())
+
+    def __contains__(self, name: str) -> bool:
+        return self.get(name) is not None
+
+    def get(self, name: str) -> Optional[Artist]:
+        """Gets an artist by its name or one of its aliases.
+
+        Parameters
+        ----------
+        name : str
+            The name or alias to search for, case insensitive.
+
+        Returns
+        -------
+        Optional[Artist]
+            The artist if found.
+        """
+        key = name.casefold()
+        artist = self._artists.get(key)
+        if artist is None:
+            key = self._aliases.get(key)
+            if key is not None:
+                artist = self._artists.get(key)
+        return artist
+
+    def add(self, artist: Artist) -> None:
+        """Adds an artist to the index, replacing any artist with the same name.
+
+        Parameters
+        ----------
+        artist : Artist
+            The artist to add.
+        """
+        key = artist.name.casefold()
+        self.remove(artist.name)
+        self._artists[key] = artist
+        self._version += 1
+        self._versions[key] = self._version
+        self._index_term(key)
+        for alias in artist.aliases:
+            alias = alias.casefold()
+            self._aliases[alias] = key
+            self._index_term(alias)
+
+    def remove(self, name: str) -> Optional[Artist]:
+        """Removes an artist and its aliases from the index.
+
+        Parameters
+        ----------
+        name : str
+            The name of the artist to remove, case insensitive.
+
+        Returns
+        -------
+        Optional[Artist]
+            The artist removed if it was indexed.
+        """
+        key = name.casefold()
+        artist = self._artists.pop(key, None)
+        self._versions.pop(key, None)
+        self.embeds.evict(key)
+        if artist is not None:
+            self._unindex_term(key)
+            for alias in artist.aliases:
+                alias = alias.casefold()
+                if self._aliases.get(alias) == key:
+                    del self._aliases[alias]
+                    self._unindex_term(alias)
+        return artist
+
+    def embed(self, artist: Artist) -> discord.Embed:
+        """Gets the rendered embed of an artist, cached until the artist is modified.
+
+        The embed is shared, so it should not be modified. Artists which are not
+        indexed are rendered every time.
+
+        Parameters
+        ----------
+        artist : Artist
+            The artist to render.
+
+        Returns
+        -------
+        discord.Embed
+            The rendered embed.
+        """
+        version = self._versions.get(artist.name.casefold())
+        if version is None:
+            return artist.embed
+        return self.embeds.get(artist, version)
+
+    def record_search(self, artist: Artist, unique_searches: int) -> Artist:
+        """Replaces an indexed artist with a copy that has one more search.
+
+        Parameters
+        ----------
+        artist : Artist
+            The artist searched for.
+        unique_searches : int
+            The new estimate of unique searchers.
+
+        Returns
+        -------
+        Artist
+            The updated artist.
+        """
+        updated = artist.replace(searches=artist.searches + 1, unique_searches=unique_searches)
+        key = artist.name.casefold()
+        if self._artists.get(key) is artist:
+            self._artists[key] = updated
+        return updated
+
+    def _index_term(self, term: str) -> None:
+        for gram in trigrams(term):
+            self._grams[gram].add(term)
+
+    def _unindex_term(self, term: str) -> None:
+        if term in self._artists or term in self._aliases:
+            return
+        for gram in trigrams(term):
+            terms = self._grams.get(gram)
+            if terms is not None:
+                terms.discard(term)
+                if not terms:
+                    del self._grams[gram]
+
+    def suggest(self, name: str, k: int = 3, *, shortlist: int = 25) -> list[str]:
+        """Suggests artists with a name or alias similar to the given name.
+
+        Candidates sharing the most trigrams with the name are shortlisted first
+        and only those are ranked by similarity.
+
+        Parameters
+        ----------
+        name : str
+            The name which wasn't found.
+        k : Optional[int]
+            The maximum amount of suggestions, by default `3`.
+        shortlist : Optional[int]
+            The amount of candidates to rank, by default `25`.
+
+        Returns
+        -------
+        list[str]
+            The names of the suggested artists, best match first.
+        """
+        query = name.casefold()
+        shared: Counter[str] = Counter()
+        for gram in trigrams(query):
+            shared.update(self._grams.get(gram, ()))
+
+        candidates = [term for term, _ in shared.most_common(shortlist)]
+        suggestions: list[str] = []
+        if not candidates:
+            return suggestions
+
+        for term in get_close_matches(query, candidates, len(candidates)):
+            artist = self.get(term)
+            if artist is not None and artist.name not in suggestions:
+                suggestions.append(artist.name)
+                if len(suggestions) == k:
+                    break
+        return suggestions
+
+    async def load(self, client: Client) -> int:
+        """Builds the index from the database if it hasn't been built yet.
+
+        Concurrent calls wait for the first load instead of reading the collection again.
+
+        Parameters
+        ----------
+        client : Client
+            The client of the `Artists` collection.
+
+        Returns
+        -------
+        int
+            The amount of artists indexed.
+        """
+        async with self._lock:
+            if self.ready:
+                return len(self)
+
+            self._artists.clear()
+            self._aliases.clear()
+            self._grams.clear()
+            self._versions.clear()
+            self.embeds.clear()
+            async for document in client.find({}):
+                self.add(Artist(document))
+            self.ready = True
+            return len(self)
+
+class SearchCounter:
+    def __init__(self, bot: Bot, *, max_pending: int = 100):
+        """Collects artist search increments in memory and writes them in one bulk write.
+
+        Also keeps a :class:`HyperLogLog` sketch of the users searching for each artist,
+        written alongside the searches as `searchers` with its estimate as `uniqueSearches`,
+        and passes the searches on to :class:`SearchAnalytics`.
+
+        Parameters
+        ----------
+        bot : Bot
+            The bot, used to access the `Artists` collection.
+        max_pending : Optional[int]
+            The amount of pending searches after which a flush is started, by default `100`.
+        """
+        self.bot = bot
+        self.max_pending = max_pending
+        self._pending: Counter[str] = Counter()
+        self._sketches: dict[str, HyperLogLog] = {}
+        self._lock = asyncio.Lock()
+        self.analytics = SearchAnalytics(bot)
+
+    @property
+    def pending(self) -> int:
+        """The amount of searches which haven't been written yet."""
+        return sum(self._pending.values())
+
+    def add(self, artist: Artist, user_id: int) -> int:
+        """Counts a search for an artist, starting a flush if too many are pending.
+
+        Parameters
+        ----------
+        artist : Artist
+            The artist searched for.
+        user_id : int
+            The ID of the user who searched.
+
+        Returns
+        -------
+        int
+            The estimated amount of unique users who searched for the artist.
+        """
+        sketch = self._sketches.get(artist.name)
+        if sketch is None:
+            sketch = self._sketches[artist.name] = HyperLogLog(artist.searchers)
+        sketch.add(user_id)
+
+        self.analytics.record(artist.name)
+        self._pending[artist.name] += 1
+        if self.pending >= self.max_pending and not self._lock.locked():
+            self.bot.loop.create_task(self.flush())
+        return sketch.count()
+
+    def rename(self, old: str, new: str) -> None:
+        """Moves the pending searches and the sketch of a renamed artist.
+
+        Parameters
+        ----------
+        old : str
+            The old name of the artist.
+        new : str
+            The new name of the artist.
+        """
+        if old == new:
+            return
+        self.analytics.rename(old, new)
+        count = self._pending.pop(old, 0)
+        if count:
+            self._pending[new] += count
+        sketch = self._sketches.pop(old, None)
+        if sketch is not None:
+            self._sketches[new] = sketch
+
+    def discard(self, name: str) -> int:
+        """Drops the pending searches and the sketch of a deleted artist.
+
+        Parameters
+        ----------
+        name : str
+            The name of the artist.
+
+        Returns
+        -------
+        int
+            The amount of searches dropped.
+        """
+        self._sketches.pop(name, None)
+        self.analytics.discard(name)
+        return self._pending.pop(name, 0)
+
+    async def flush(self) -> int:
+        """Writes all the pending searches as a single unordered bulk write, then
+        flushes the analytics.
+
+        If the write fails the searches are kept so that the next flush retries them.
+        Only the updates listed as failed in a :class:`BulkWriteError` are kept, since
+        the others have already been applied. The analytics are flushed even without any pending searches, so buckets left
+        over from a failed analytics write are retried too.
+
+        Returns
+        -------
+        int
+            The amount of artists updated.
+        """
+        async with self._lock:
+            requests = []
+            if self._pending:
+                pending, self._pending = self._pending, Counter()
+                names = list(pending)
+                for name in names:
+                    update = {'$inc':{'searches':pending[name]}}
+                    sketch = self._sketches.get(name)
+                    if sketch is not None:
+                        update['$set'] = {'searchers':sketch.to_bytes(), 'uniqueSearches':sketch.count()}
+                    requests.append(UpdateOne({'name':name}, update))
+
+                try:
+                    await self.bot.artists.bulk_write(requests, ordered=False)
+                except BulkWriteError as e:
+                    # the other increments were applied, retrying them would count them twice
+                    for error in e.details.get('writeErrors', []):
+                        name = names[error['index']]
+                        self._pending[name] += pending[name]
+                    raise
+                except Exception:
+                    self._pending.update(pending)
+                    raise
+            await self.analytics.flush()
+            return len(requests)
@@ -0,0 +1,164 @@
+"""
+Audit log tail cache
+Copyright (C) 2021  ItsArtemiz (Augadh Verma)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import discord
+import time
+
+from collections import OrderedDict
+from typing import Optional
+
+_Key = tuple[discord.AuditLogAction, int]
+
+class _Tail:
+    __slots__ = ('entries', 'newest', 'fetched_at', 'lock')
+
+    def __init__(self):
+        # (action, target ID) -> newest entry, least recent first
+        self.entries: OrderedDict[_Key, discord.AuditLogEntry] = OrderedDict()
+        self.newest: Optional[int] = None
+        self.fetched_at = 0.0
+        self.lock = asyncio.Lock()
+
+class AuditLogTail:
+    def __init__(
+        self,
+        *,
+        ttl: float = 30.0,
+        limit: int = 100,
+        pages: int = 3,
+        keep: int = 300,
+        max_age: float = 60.0
+    ):
+        """Caches the most recent audit log entries of each guild, of every action.
+
+        One tail per guild serves the lookups of all the moderation listeners. A lookup
+        which misses fetches only the entries newer than the newest one cached, and
+        concurrent lookups for the same guild share that fetch. During a wave of bans
+        most lookups are served from the entries fetched for an earlier one.
+
+        Parameters
+        ----------
+        ttl : Optional[float]
+            The seconds after which a guild's cached entries are thrown away, by default `30.0`.
+        limit : Optional[int]
+            The amount of entries to fetch at once, by default `100`, the most Discord allows.
+        pages : Optional[int]
+            The maximum amount of fetches made by a single lookup, by default `3`.
+        keep : Optional[int]
+            The maximum amount of entries to keep per guild, by default `300`.
+        max_age : Optional[float]
+            The seconds after which an entry is too old to belong to a new event, by
+            default `60.0`. Keeps a user banned again later from getting the old reason.
+        """
+        self.ttl = ttl
+        self.max_age = max_age
+        self.limit = limit
+        self.pages = pages
+        self.keep = keep
+        self._tails: dict[int, _Tail] = {}
+
+    def _expired(self, tail: _Tail, now: float) -> bool:
+        return not tail.lock.locked() and now - tail.fetched_at > self.ttl
+
+    def _get_tail(self, guild_id: int) -> _Tail:
+        now = time.monotonic()
+        tail = self._tails.get(guild_id)
+        if tail is None or self._expired(tail, now):
+            # drop every other expired tail too so guilds which stopped moderating don't pile up
+            for k in [k for k, t in self._tails.items() if self._expired(t, now)]:
+                del self._tails[k]
+            tail = self._tails[guild_id] = _Tail()
+        return tail
+
+    async def _fetch(self, guild: discord.Guild, tail: _Tail) -> None:
+        for _ in range(self.pages):
+            after = discord.Object(id=tail.newest) if tail.newest else None
+            fetched = 0
+            async for entry in guild.audit_logs(limit=self.limit, after=after):
+                fetched += 1
+                target_id = getattr(entry.target, 'id', None)
+                if target_id is not None:
+                    key = (entry.action, target_id)
+                    tail.entries[key] = entry
+                    tail.entries.move_to_end(key)
+                if tail.newest is None or entry.id > tail.newest:
+                    tail.newest = entry.id
+            # the first fetch already has the newest entries, later ones catch up oldest first
+            if after is None or fetched < self.limit:
+                break
+
+        while len(tail.entries) > self.keep:
+            tail.entries.popitem(last=False)
+        tail.fetched_at = time.monotonic()
+
+    def _recent(self, entry: Optional[discord.AuditLogEntry]) -> bool:
+        if entry is None:
+            return False
+        return (discord.utils.utcnow() - entry.created_at).total_seconds() <= self.max_age
+
+    async def find(
+        self,
+        guild: discord.Guild,
+        action: discord.AuditLogAction,
+        target_id: int
+    ) -> Optional[discord.AuditLogEntry]:
+        """Finds the most recent audit log entry of an action on a target.
+
+        Parameters
+        ----------
+        guild : discord.Guild
+            The guild to search the audit logs of.
+        action : discord.AuditLogAction
+            The action, e.g. `discord.AuditLogAction.ban`.
+        target_id : int
+            The ID of the target, e.g. the banned user.
+
+        Returns
+        -------
+        Optional[discord.AuditLogEntry]
+            The entry if found in the recent audit logs and made in the last `max_age` seconds.
+        """
+        key = (action, target_id)
+        tail = self._get_tail(guild.id)
+        entry = tail.entries.get(key)
+        if self._recent(entry):
+            return entry
+
+        async with tail.lock:
+            # another lookup might have fetched it while we waited
+            entry = tail.entries.get(key)
+            if not self._recent(entry):
+                await self._fetch(guild, tail)
+                entry = tail.entries.get(key)
+        return entry if self._recent(entry) else None
+
+    def clear(self, guild_id: Optional[int] = None) -> None:
+        """Throws away the cached entries.
+
+        Parameters
+        ----------
+        guild_id : Optional[int]
+            Only throw away the entries of this guild.
+        """
+        if guild_id is None:
+            self._tails.clear()
+        else:
+            self._tails.pop(guild_id, None)
@@ -23,7 +23,11 @@ import os
 from typing import Iterable, List, Optional
 from datetime import datetime
 from discord.ext import commands
+from pymongo.errors import OperationFailure
+from utils.archive import EventArchive
 from utils.db import Client
+from utils.dispatcher import LogDispatcher
+from utils.settings import LogChannelResolver, SettingsCache
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -33,6 +37,7 @@ Hello World! I am a bot written by ItsArtemiz#8858 to provide some utilities.
 
 URI = os.environ.get('DB_TOKEN')
 TOKEN = os.environ.get('BOT_TOKEN')
+ARCHIVE_PATH = os.environ.get('EVENT_ARCHIVE', 'events.db')
 
 os.environ["JISHAKU_NO_UNDERSCORE"] = "True"
 os.environ["JISHAKU_NO_DM_TRACEBACK"] = "True" 
@@ -58,21 +63,9 @@ EXTENSIONS = {
 }
 
 async def get_pre(bot, message:discord.Message) -> Iterable[str]:
-    user_id = bot.user.id
-    base = [f'<@{user_id}>', f'<@!{user_id}>']
     if message.guild is None:
-        base.append('.')
-    else:
-        settings: dict = await bot.settings.find_one({'guildId':message.guild.id})
-        if settings:
-            prefixes = settings.get('prefixes', ['.'])
-            if prefixes:
-                base.extend(prefixes)
-            else:
-                base.append('.')
-        else:
-            base.append('.')
-    return list(set(base))
+        return bot.settings_cache.default_prefixes
+    return await bot.settings_cache.get_prefixes(message.guild.id)
 
 class Bot(commands.Bot):
     """The actual robot!!"""
@@ -85,11 +78,22 @@ class Bot(commands.Bot):
             description=DESCRIPTION,
             allowed_mentions=ALLOWEDMENTIONS,
             intents=intents,
+            # the delete and edit logs use cogs.logging's own message store instead
+            max_messages=100,
             owner_id=449897807936225290,
             case_insensitive=True,
             strip_after_prefix=True
         )
         
+        # circular import, utils.utils needs the Bot
+        from utils.artists import ArtistIndex, SearchCounter
+
+        self.settings_cache = SettingsCache(self)
+        self.log_channels = LogChannelResolver(self)
+        self.log_dispatcher = LogDispatcher(self)
+        self.artist_index = ArtistIndex()
+        self.search_counter = SearchCounter(self)
+        self.event_archive = EventArchive(ARCHIVE_PATH)
         self.loop.create_task(self.create_session())
 
         self.colour = 0xce0037
@@ -107,22 +111,60 @@ class Bot(commands.Bot):
         
     async def create_session(self) -> None:
         await self.wait_until_ready()
+        try:
+            await self.event_archive.start()
+        except Exception as e:
+            print(f'Failed to start the event archive: {e}')
         if not hasattr(self, 'session'):
             self.session = aiohttp.ClientSession()
         if not hasattr(self, 'artists'):
             self.artists = Client(URI, 'DSCN', 'Artists')
+        if not hasattr(self, 'search_stats'):
+            self.search_stats = Client(URI, 'DSCN', 'ArtistSearches')
         if not hasattr(self, 'utils'):
             self.settings = Client(URI, 'Utils', 'Settings')
+            await self.preload_settings()
+        await self.create_indexes()
+        if not self.artist_index.ready:
+            await self.artist_index.load(self.artists)
         # if not hasattr(self, 'tags'):
         #     self.tags = Client(URI, 'DSCN', 'Tags')
         # if not hasattr(self, 'utils'):
         #     self.utils = Client(URI, 'DSCN', 'Utils')
 
+    async def create_indexes(self) -> None:
+        from utils.analytics import SEARCH_STATS_INDEXES
+        from utils.artists import ARTIST_INDEXES
+        
+        # one collection's conflicting index shouldn't keep the other's from being made
+        for collection, indexes in ((self.artists, ARTIST_INDEXES), (self.search_stats, SEARCH_STATS_INDEXES)):
+            try:
+                await collection.create_indexes(indexes)
+            except OperationFailure as e:
+                print(f'Failed to create the indexes of {collection.collection.name}: {e}')
+
+    async def preload_settings(self) -> None:
+        loaded, elapsed = await self.settings_cache.preload(g.id for g in self.guilds)
+        print(f'PRELOAD: {loaded} guild settings in {elapsed:.2f}ms')
+
     async def on_ready(self) -> None:
         print(f'READY: {self.user} (ID:{self.user.id})')
 
         if not hasattr(self, 'uptime'):
             self.uptime = datetime.utcnow()
             
+    async def close(self) -> None:
+        # the analytics are flushed on their own too in case the search counts fail
+        for flush in (self.search_counter.flush, self.search_counter.analytics.flush, self.log_dispatcher.flush):
+            try:
+                await flush()
+            except Exception as e:
+                print(f'Failed to flush before closing: {e}')
+        try:
+            await self.event_archive.close()
+        except Exception as e:
+            print(f'Failed to close the event archive: {e}')
+        await super().close()
+            
     def run(self, *args, **kwargs):
         return super().run(TOKEN, *args, **kwargs)
\ No newline at end of file
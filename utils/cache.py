@@ -22,34 +22,108 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
+from __future__ import annotations
+
+import asyncio
+import functools
+import sys
 import time
-from typing import Any, TypeVar
+import weakref
+
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Iterator, Optional, TypeVar
 
 _KT = TypeVar('_KT')
 _VT = TypeVar('_VT')
 
+_MISSING = object()
+
+_registry: weakref.WeakValueDictionary[str, ExpiringCache] = weakref.WeakValueDictionary()
+
+def registered_caches() -> dict[str, ExpiringCache]:
+    """The named caches which are still alive, by name."""
+    return dict(sorted(_registry.items()))
+
 class ExpiringCache(dict):
-    def __init__(self, seconds: int, *, case_insensitive: bool=False):
+    def __init__(
+        self,
+        seconds: Optional[float],
+        *,
+        maxsize: Optional[int] = None,
+        case_insensitive: bool=False,
+        name: Optional[str] = None
+    ):
         """Makes a timed cache. Deletes cache after the time has expired.
 
         Returns the value as (value, time)
-        
+
+        Keys are kept in the order they were set, which is also the order they expire in,
+        so expired keys are swept from the front on each access instead of checking every
+        key. With a `maxsize` the least recently used key is dropped when the cache is full.
+
         Parameters
         ----------
-        seconds : int
-            The seconds to cache items for.
+        seconds : Optional[float]
+            The seconds to cache items for. `None` caches them until they are evicted.
+        maxsize : Optional[int]
+            The maximum amount of items to keep. By default there is no limit.
         case_insensitive : Optional[bool]
             Whether to use a case insensitive dict or not. By default `False`.
+        name : Optional[str]
+            Registers the cache under this name so that its stats can be found with
+            :func:`registered_caches`.
         """
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
         self.__ttl = seconds
+        self.__maxsize = maxsize
         self.__case = case_insensitive
+        # key -> time it was set, oldest first
+        self.__expiry: OrderedDict[Any, float] = OrderedDict()
+        # key -> None, least recently used first
+        self.__recency: OrderedDict[Any, None] = OrderedDict()
         super().__init__()
+        if name is not None:
+            _registry[name] = self
+
+    @property
+    def ttl(self) -> Optional[float]:
+        return self.__ttl
+
+    @property
+    def maxsize(self) -> Optional[int]:
+        return self.__maxsize
+
+    @property
+    def hit_rate(self) -> Optional[float]:
+        """The share of lookups which were hits, or `None` before the first lookup."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else None
+
+    def memory_usage(self) -> int:
+        """Approximates the bytes used by the cache, its keys and its values.
+
+        Values are measured shallowly, so e.g. the contents of a cached dict are not counted.
+        """
+        size = sys.getsizeof(self) + sys.getsizeof(self.__expiry) + sys.getsizeof(self.__recency)
+        for k, v in super().items():
+            size += sys.getsizeof(k) + sys.getsizeof(v) + sys.getsizeof(v[0])
+        return size
 
     def __verify_cache_integrity(self) -> None:
-        current_time = time.monotonic()
-        to_remove = [k for (k, (v,t)) in self.items() if current_time > (t + self.__ttl)]
-        for k in to_remove:
-            del self[k]
+        if self.__ttl is None:
+            return
+        deadline = time.monotonic() - self.__ttl
+        expiry = self.__expiry
+        while expiry:
+            key, t = next(iter(expiry.items()))
+            if t >= deadline:
+                break
+            self.__remove(key)
+            self.expired += 1
 
     def __check_case_sensitive(self, key: _KT) -> Any:
         if self.__case:
@@ -57,6 +131,15 @@ class ExpiringCache(dict):
                 return key.lower()
         return key
 
+    def __remove(self, key: Any) -> None:
+        super().__delitem__(key)
+        self.__expiry.pop(key, None)
+        self.__recency.pop(key, None)
+
+    def __touch(self, key: Any) -> None:
+        if self.__maxsize is not None:
+            self.__recency.move_to_end(key)
+
     def __contains__(self, key: _KT) -> bool:
         self.__verify_cache_integrity()
         key = self.__check_case_sensitive(key)
@@ -65,8 +148,176 @@ class ExpiringCache(dict):
     def __getitem__(self, key: _KT) -> _VT:
         self.__verify_cache_integrity()
         key = self.__check_case_sensitive(key)
+        try:
+            value = super().__getitem__(key)
+        except KeyError:
+            self.misses += 1
+            raise
+        self.hits += 1
+        self.__touch(key)
+        return value
+
+    def get(self, key: _KT, default: Any = None) -> Any:
+        self.__verify_cache_integrity()
+        key = self.__check_case_sensitive(key)
+        if not super().__contains__(key):
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.__touch(key)
+        return super().__getitem__(key)
+
+    def peek(self, key: _KT, default: Any = None) -> Any:
+        """Like :meth:`get`, but without counting a hit or miss or marking the key as used."""
+        self.__verify_cache_integrity()
+        key = self.__check_case_sensitive(key)
+        if not super().__contains__(key):
+            return default
         return super().__getitem__(key)
 
     def __setitem__(self, k: _KT, v: _VT) -> None:
+        self.__verify_cache_integrity()
+        k = self.__check_case_sensitive(k)
+        now = time.monotonic()
+        super().__setitem__(k, (v, now))
+        if self.__ttl is not None:
+            self.__expiry[k] = now
+            self.__expiry.move_to_end(k)
+        if self.__maxsize is not None:
+            self.__recency[k] = None
+            self.__recency.move_to_end(k)
+            while len(self.__recency) > self.__maxsize:
+                self.__remove(next(iter(self.__recency)))
+                self.evicted += 1
+
+    def __delitem__(self, k: _KT) -> None:
+        k = self.__check_case_sensitive(k)
+        self.__remove(k)
+
+    def pop(self, k: _KT, default: Any = _MISSING) -> Any:
+        self.__verify_cache_integrity()
         k = self.__check_case_sensitive(k)
-        return super().__setitem__(k, (v, time.monotonic()))
\ No newline at end of file
+        if super().__contains__(k):
+            value = super().__getitem__(k)
+            self.__remove(k)
+            return value
+        if default is _MISSING:
+            raise KeyError(k)
+        return default
+
+    def popitem(self) -> tuple[Any, Any]:
+        self.__verify_cache_integrity()
+        item = super().popitem()
+        self.__expiry.pop(item[0], None)
+        self.__recency.pop(item[0], None)
+        return item
+
+    def setdefault(self, k: _KT, default: Any = None) -> Any:
+        if k not in self:
+            self[k] = default
+        return self[k]
+
+    def update(self, *args, **kwargs) -> None:
+        for k, v in dict(*args, **kwargs).items():
+            self[k] = v
+
+    def clear(self) -> None:
+        super().clear()
+        self.__expiry.clear()
+        self.__recency.clear()
+
+    def __len__(self) -> int:
+        self.__verify_cache_integrity()
+        return super().__len__()
+
+    def __iter__(self) -> Iterator[_KT]:
+        self.__verify_cache_integrity()
+        return super().__iter__()
+
+    def keys(self):
+        self.__verify_cache_integrity()
+        return super().keys()
+
+    def values(self):
+        self.__verify_cache_integrity()
+        return super().values()
+
+    def items(self):
+        self.__verify_cache_integrity()
+        return super().items()
+
+def _make_key(args: tuple, kwargs: dict) -> Hashable:
+    if kwargs:
+        return args + tuple(sorted(kwargs.items()))
+    return args
+
+def async_cached(
+    seconds: Optional[float] = None,
+    *,
+    maxsize: Optional[int] = None,
+    key: Optional[Callable[..., Hashable]] = None,
+    name: Optional[str] = None
+):
+    """Caches the results of a coroutine function in an :class:`ExpiringCache`.
+
+    Concurrent calls with the same key share a single call instead of each making
+    their own, so a burst of lookups on a cold cache only runs the function once.
+    Exceptions are passed to every waiting caller and are not cached.
+
+    The decorated function gets an `invalidate` function, which takes the same
+    arguments, a `clear` function and the `cache` itself.
+
+    Parameters
+    ----------
+    seconds : Optional[float]
+        The seconds to cache results for. `None` caches them until they are evicted,
+        `0` doesn't cache them at all and only shares concurrent calls.
+    maxsize : Optional[int]
+        The maximum amount of results to keep. By default there is no limit.
+    key : Optional[Callable[..., Hashable]]
+        Makes the cache key from the arguments. By default all the arguments are used.
+    name : Optional[str]
+        The name to register the cache under, by default the function's qualified name.
+        Functions which don't cache their results are not registered.
+    """
+    def decorator(func: Callable[..., Awaitable[_VT]]) -> Callable[..., Awaitable[_VT]]:
+        cache = ExpiringCache(seconds, maxsize=maxsize, name=(name or func.__qualname__) if seconds != 0 else None)
+        pending: dict[Hashable, asyncio.Future] = {}
+        make_key = key or (lambda *args, **kwargs: _make_key(args, kwargs))
+
+        def done(k: Hashable, future: asyncio.Future) -> None:
+            # an invalidated call is no longer pending and its result is stale
+            if pending.get(k) is not future:
+                return
+            del pending[k]
+            if seconds != 0 and not future.cancelled() and future.exception() is None:
+                cache[k] = future.result()
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs) -> _VT:
+            k = make_key(*args, **kwargs)
+            cached = cache.get(k)
+            if cached is not None:
+                return cached[0]
+
+            future = pending.get(k)
+            if future is None:
+                future = pending[k] = asyncio.ensure_future(func(*args, **kwargs))
+                future.add_done_callback(functools.partial(done, k))
+            # one caller being cancelled shouldn't cancel the call for everyone else
+            return await asyncio.shield(future)
+
+        def invalidate(*args, **kwargs) -> None:
+            k = make_key(*args, **kwargs)
+            cache.pop(k, None)
+            pending.pop(k, None)
+
+        def clear() -> None:
+            cache.clear()
+            pending.clear()
+
+        wrapper.cache = cache
+        wrapper.invalidate = invalidate
+        wrapper.clear = clear
+        return wrapper
+    return decorator
@@ -82,7 +82,7 @@ def botchannel():
             raise commands.NoPrivateMessage('This command cannot be used in DMs.')
         if ctx.author.guild_permissions.manage_guild:
             return True
-        settings = await ctx.bot.settings.find_one({'guildId':ctx.guild.id})
+        settings = await ctx.bot.settings_cache.get(ctx.guild.id)
         if settings is None:
             return True
         if ctx.channel.id in settings.get('disabledChannels', []):
@@ -20,6 +20,7 @@ from __future__ import annotations
 
 from typing import Iterable, List, Optional
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorCollection, AsyncIOMotorCursor
+from pymongo import IndexModel
 from pymongo.results import (
     BulkWriteResult,
     DeleteResult,
@@ -129,6 +130,24 @@ class Client:
         """
         return await self.collection.bulk_write(requests, ordered=ordered, **kwargs)
 
+    async def create_indexes(self, indexes: List[IndexModel], **kwargs) -> List[str]:
+        """Creates the indexes on the collection if they don't exist yet.
+
+        Creating an index which already exists with the same keys and options does nothing,
+        so this is safe to run on every startup.
+
+        Parameters
+        ----------
+        indexes : List[IndexModel]
+            The indexes to create.
+
+        Returns
+        -------
+        List[str]
+            The names of the indexes.
+        """
+        return await self.collection.create_indexes(indexes, **kwargs)
+
     async def count_documents(self, filter: dict, **kwargs) -> int:
         """Counts the documents in the given collection according to the filter.
 
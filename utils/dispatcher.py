@@ -0,0 +1,321 @@
+"""
+Batched log delivery
+Copyright (C) 2021  ItsArtemiz (Augadh Verma)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import discord
+import io
+
+from collections import OrderedDict, deque
+from typing import TYPE_CHECKING, Optional
+from utils.cache import ExpiringCache
+
+if TYPE_CHECKING:
+    from utils.bot import Bot
+
+MAX_EMBEDS = 10
+MAX_EMBED_CHARACTERS = 6000
+MAX_TITLE = 256
+MAX_DESCRIPTION = 4096
+MAX_FIELD_VALUE = 1024
+
+def _shorten(text: str, limit: int) -> str:
+    return text if len(text) <= limit else f'{text[:limit - 3]}...'
+
+def fit_embed(embed: discord.Embed) -> discord.Embed:
+    """Shortens the title, description and field values of an embed to Discord's limits.
+
+    Logged messages can be longer than a field allows, and a single embed over the
+    limits makes Discord reject the whole message it is in.
+
+    Parameters
+    ----------
+    embed : discord.Embed
+        The embed, shortened in place.
+
+    Returns
+    -------
+    discord.Embed
+        The same embed.
+    """
+    if embed.title and len(embed.title) > MAX_TITLE:
+        embed.title = _shorten(embed.title, MAX_TITLE)
+    if embed.description and len(embed.description) > MAX_DESCRIPTION:
+        embed.description = _shorten(embed.description, MAX_DESCRIPTION)
+    for i, field in enumerate(embed.fields):
+        if field.value and len(field.value) > MAX_FIELD_VALUE:
+            embed.set_field_at(i, name=field.name, value=_shorten(field.value, MAX_FIELD_VALUE), inline=field.inline)
+    return embed
+
+WEBHOOK_NAME = 'DSCN Logs'
+
+class WebhookPool:
+    def __init__(self, bot: Bot, *, maxsize: int = 1000, retry_after: float = 300.0):
+        """Creates or reuses one webhook per log channel and caches it.
+
+        The webhooks are bound to the bot's shared session, so messages sent through
+        them use the webhook's rate limits instead of the bot's. Channels where a webhook
+        can't be made because of missing permissions are remembered for `retry_after`
+        seconds, so the permission can be granted without restarting the bot.
+
+        Parameters
+        ----------
+        bot : Bot
+            The bot.
+        maxsize : Optional[int]
+            The maximum amount of channels to keep in memory, by default `1000`.
+        retry_after : Optional[float]
+            The seconds to wait before trying a forbidden channel again, by default `300.0`.
+        """
+        self.bot = bot
+        self.maxsize = maxsize
+        self._cache: OrderedDict[int, discord.Webhook] = OrderedDict()
+        self._forbidden = ExpiringCache(retry_after, maxsize=maxsize)
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    async def get(self, channel: discord.TextChannel) -> Optional[discord.Webhook]:
+        """Gets the log webhook of a channel, creating it if needed.
+
+        Parameters
+        ----------
+        channel : discord.TextChannel
+            The log channel.
+
+        Returns
+        -------
+        Optional[discord.Webhook]
+            The webhook if there is one or it could be made.
+        """
+        if channel.id in self._cache:
+            self._cache.move_to_end(channel.id)
+            return self._cache[channel.id]
+        if channel.id in self._forbidden:
+            return None
+
+        webhook = None
+        try:
+            for hook in await channel.webhooks():
+                if hook.token and hook.user and hook.user.id == self.bot.user.id:
+                    webhook = hook
+                    break
+            else:
+                webhook = await channel.create_webhook(name=WEBHOOK_NAME)
+        except discord.Forbidden:
+            self._forbidden[channel.id] = True
+            return None
+        except discord.HTTPException:
+            # might work next time, so don't cache anything
+            return None
+
+        webhook = discord.Webhook.from_url(webhook.url, session=self.bot.session)
+        self._cache[channel.id] = webhook
+        if len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+        return webhook
+
+    def invalidate(self, channel_id: int) -> None:
+        """Removes the webhook of a channel, e.g. after it got deleted, and tries again
+        next time if it was forbidden.
+
+        Parameters
+        ----------
+        channel_id : int
+            The ID of the channel.
+        """
+        self._cache.pop(channel_id, None)
+        self._forbidden.pop(channel_id, None)
+
+class LogDispatcher:
+    def __init__(self, bot: Bot, *, delay: float = 2.0, max_queue: int = 100):
+        """Queues log embeds per channel and sends them grouped, up to 10 embeds per message.
+
+        A channel's queue is sent `delay` seconds after its first embed was queued, or
+        as soon as a full message is waiting. Each channel sends one message at a time.
+        When a queue is full, its oldest embed is dropped.
+
+        Guilds which enabled `logWebhook` in their settings get their logs through a
+        webhook from :class:`WebhookPool`, falling back to the channel if there is none or it fails.
+
+        Parameters
+        ----------
+        bot : Bot
+            The bot.
+        delay : Optional[float]
+            The seconds to wait for more embeds before sending, by default `2.0`.
+        max_queue : Optional[int]
+            The maximum amount of embeds queued per channel, by default `100`.
+        """
+        self.bot = bot
+        self.delay = delay
+        self.max_queue = max_queue
+        self._queues: dict[int, deque[discord.Embed]] = {}
+        self._channels: dict[int, discord.TextChannel] = {}
+        self._full: dict[int, asyncio.Event] = {}
+        self._workers: dict[int, asyncio.Task] = {}
+        self.webhooks = WebhookPool(bot)
+
+        self.sent_messages = 0
+        self.sent_embeds = 0
+        self.dropped = 0
+
+    @property
+    def depth(self) -> int:
+        """The amount of embeds waiting to be sent across all channels."""
+        return sum(len(q) for q in self._queues.values())
+
+    def depths(self) -> dict[int, int]:
+        """The amount of embeds waiting to be sent, by channel ID."""
+        return {channel_id: len(q) for channel_id, q in self._queues.items() if q}
+
+    def queue(self, channel: discord.TextChannel, embed: discord.Embed) -> None:
+        """Queues an embed to be sent to a channel.
+
+        Parameters
+        ----------
+        channel : discord.TextChannel
+            The channel to send the embed to.
+        embed : discord.Embed
+            The embed to send.
+        """
+        queue = self._queues.get(channel.id)
+        if queue is None:
+            queue = self._queues[channel.id] = deque(maxlen=self.max_queue)
+            self._full[channel.id] = asyncio.Event()
+        if len(queue) == queue.maxlen:
+            self.dropped += 1
+
+        queue.append(fit_embed(embed))
+        self._channels[channel.id] = channel
+        if len(queue) >= MAX_EMBEDS:
+            self._full[channel.id].set()
+        if channel.id not in self._workers:
+            self._workers[channel.id] = self.bot.loop.create_task(self._worker(channel.id))
+
+    async def send(self, channel: discord.TextChannel, embed: discord.Embed, *, data: bytes, filename: str) -> None:
+        """Sends an embed with a file right away, the same way queued embeds are sent.
+
+        Files can't be grouped with other embeds, so these skip the queue. The file is
+        made again from `data` for every attempt, since a sent file is read to its end.
+
+        Parameters
+        ----------
+        channel : discord.TextChannel
+            The channel to send to.
+        embed : discord.Embed
+            The embed to send.
+        data : bytes
+            The contents of the file to attach.
+        filename : str
+            The name of the file.
+        """
+        await self._send(channel, [fit_embed(embed)], attachment=(data, filename))
+
+    def _take(self, queue: deque[discord.Embed]) -> list[discord.Embed]:
+        batch: list[discord.Embed] = []
+        characters = 0
+        while queue and len(batch) < MAX_EMBEDS:
+            size = len(queue[0])
+            if batch and characters + size > MAX_EMBED_CHARACTERS:
+                break
+            batch.append(queue.popleft())
+            characters += size
+        return batch
+
+    async def _use_webhook(self, channel: discord.TextChannel) -> bool:
+        settings = await self.bot.settings_cache.get(channel.guild.id)
+        return bool(settings and settings.get('logWebhook'))
+
+    def _file(self, attachment: Optional[tuple[bytes, str]]) -> dict:
+        if attachment is None:
+            return {}
+        data, filename = attachment
+        return {'file':discord.File(io.BytesIO(data), filename=filename)}
+
+    async def _send_webhook(
+        self,
+        channel: discord.TextChannel,
+        embeds: list[discord.Embed],
+        attachment: Optional[tuple[bytes, str]] = None
+    ) -> bool:
+        webhook = await self.webhooks.get(channel)
+        if webhook is None:
+            return False
+
+        user = self.bot.user
+        try:
+            await webhook.send(
+                embeds=embeds,
+                username=user.name,
+                avatar_url=user.avatar.url if user.avatar else None,
+                **self._file(attachment)
+            )
+        except discord.HTTPException:
+            # the webhook might have been deleted or lost its permissions, so make a new
+            # one next time and send this batch through the channel instead
+            self.webhooks.invalidate(channel.id)
+            return False
+        return True
+
+    async def _send(
+        self,
+        channel: discord.TextChannel,
+        embeds: list[discord.Embed],
+        attachment: Optional[tuple[bytes, str]] = None
+    ) -> None:
+        try:
+            if not (await self._use_webhook(channel) and await self._send_webhook(channel, embeds, attachment)):
+                await channel.send(embeds=embeds, **self._file(attachment))
+        except discord.HTTPException as e:
+            if e.status == 400 and len(embeds) > 1:
+                # one bad embed shouldn't lose the others, so find it by sending them one by one
+                for embed in embeds:
+                    await self._send(channel, [embed])
+                return
+            self.dropped += len(embeds)
+        else:
+            self.sent_messages += 1
+            self.sent_embeds += len(embeds)
+
+    async def _worker(self, channel_id: int) -> None:
+        try:
+            try:
+                await asyncio.wait_for(self._full[channel_id].wait(), timeout=self.delay)
+            except asyncio.TimeoutError:
+                pass
+            await self._drain(channel_id)
+        finally:
+            self._workers.pop(channel_id, None)
+
+    async def _drain(self, channel_id: int) -> None:
+        queue = self._queues[channel_id]
+        full = self._full[channel_id]
+        while queue:
+            full.clear()
+            await self._send(self._channels[channel_id], self._take(queue))
+        del self._queues[channel_id]
+        del self._full[channel_id]
+        del self._channels[channel_id]
+
+    async def flush(self) -> None:
+        """Sends everything queued right away, e.g. before shutting down."""
+        for full in self._full.values():
+            full.set()
+        await asyncio.gather(*self._workers.values(), return_exceptions=True)
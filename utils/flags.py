@@ -34,4 +34,9 @@ class ArtistEdit(commands.FlagConverter, case_insensitive=True):
     music: Optional[str]
     release: Optional[str]
     avatar: Optional[Union[discord.User, str]]
-    aliases: Optional[str]
\ No newline at end of file
+    aliases: Optional[str]
+
+class LogSearch(commands.FlagConverter, case_insensitive=True):
+    user: Optional[discord.User]
+    channel: Optional[discord.TextChannel]
+    type: Optional[str]
@@ -0,0 +1,110 @@
+"""
+HyperLogLog - Approximate unique counts in a fixed amount of memory
+Copyright (C) 2021  ItsArtemiz (Augadh Verma)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import math
+
+from typing import Optional
+
+class HyperLogLog:
+    """Estimates how many unique values were added using `2 ** precision` one byte registers.
+
+    With the default precision of `8` a sketch takes 256 bytes and the estimate is
+    usually within about 6.5% of the real count.
+    """
+    __slots__ = ('precision', 'registers')
+
+    def __init__(self, registers: Optional[bytes] = None, *, precision: int = 8):
+        """
+        Parameters
+        ----------
+        registers : Optional[bytes]
+            The registers of a sketch saved with :meth:`to_bytes`. An empty or missing
+            value (or one of the wrong size) starts an empty sketch.
+        precision : Optional[int]
+            The amount of bits of the hash used to pick a register, by default `8`.
+        """
+        self.precision = precision
+        size = 1 << precision
+        if registers and len(registers) == size:
+            self.registers = bytearray(registers)
+        else:
+            self.registers = bytearray(size)
+
+    def __len__(self) -> int:
+        return self.count()
+
+    def add(self, value: int | str) -> bool:
+        """Adds a value to the sketch.
+
+        Parameters
+        ----------
+        value : Union[int, str]
+            The value to add, e.g. a user ID.
+
+        Returns
+        -------
+        bool
+            Whether the sketch changed.
+        """
+        digest = hashlib.blake2b(str(value).encode(), digest_size=8).digest()
+        hashed = int.from_bytes(digest, 'big')
+        index = hashed >> (64 - self.precision)
+        rest = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+            return True
+        return False
+
+    def count(self) -> int:
+        """Estimates the amount of unique values added.
+
+        Returns
+        -------
+        int
+            The estimated count.
+        """
+        size = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / sum(2.0 ** -r for r in self.registers)
+
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * size and zeros:
+            # small range correction (linear counting)
+            estimate = size * math.log(size / zeros)
+        return round(estimate)
+
+    def merge(self, other: HyperLogLog) -> None:
+        """Merges another sketch of the same precision into this one.
+
+        Parameters
+        ----------
+        other : HyperLogLog
+            The sketch to merge.
+        """
+        if other.precision != self.precision:
+            raise ValueError('cannot merge sketches of different precision')
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def to_bytes(self) -> bytes:
+        """The registers of the sketch, to be saved and loaded back with the constructor."""
+        return bytes(self.registers)
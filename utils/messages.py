@@ -0,0 +1,181 @@
+"""
+Message content store for the delete and edit logs
+Copyright (C) 2021  ItsArtemiz (Augadh Verma)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from __future__ import annotations
+
+import discord
+import time
+
+from collections import OrderedDict
+from typing import Optional
+
+class StoredMessage:
+    """The parts of a message needed to log its deletion or edit."""
+    __slots__ = ('id', 'channel_id', 'author_id', 'content', 'attachments', 'stored_at')
+
+    def __init__(self, message: discord.Message):
+        self.id: int = message.id
+        self.channel_id: int = message.channel.id
+        self.author_id: int = message.author.id
+        self.content: str = message.content
+        self.attachments: tuple[str, ...] = tuple(a.filename for a in message.attachments)
+        self.stored_at = time.monotonic()
+
+    def __repr__(self) -> str:
+        return f'<StoredMessage id={self.id} channel_id={self.channel_id} author_id={self.author_id}>'
+
+class MessageStore:
+    def __init__(self, *, per_guild: int = 2000, max_messages: int = 50000, max_age: float = 60 * 60 * 24):
+        """Keeps the content of recent messages by guild, for the raw delete and edit events.
+
+        Unlike discord.py's message cache this only holds the content, author ID and
+        attachment names, and every guild has its own quota so one busy guild can't
+        push out the messages of all the others. A guild's least recently used message
+        is dropped when it is over its quota, and the oldest message overall is dropped
+        when the store is full. Messages older than `max_age` are dropped by
+        :meth:`sweep`, which also runs as new messages come in.
+
+        Parameters
+        ----------
+        per_guild : Optional[int]
+            The maximum amount of messages kept per guild, by default `2000`.
+        max_messages : Optional[int]
+            The maximum amount of messages kept overall, by default `50000`.
+        max_age : Optional[float]
+            The seconds a message is kept for, by default a day.
+        """
+        self.per_guild = per_guild
+        self.max_messages = max_messages
+        self.max_age = max_age
+        # guild ID -> message ID -> message, least recently used first
+        self._guilds: dict[int, OrderedDict[int, StoredMessage]] = {}
+        # message ID -> guild ID, oldest first
+        self._ages: OrderedDict[int, int] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._ages)
+
+    def _remove(self, guild_id: int, message_id: int) -> Optional[StoredMessage]:
+        self._ages.pop(message_id, None)
+        messages = self._guilds.get(guild_id)
+        if messages is None:
+            return None
+        stored = messages.pop(message_id, None)
+        if not messages:
+            del self._guilds[guild_id]
+        return stored
+
+    def _pop_oldest(self) -> None:
+        message_id, guild_id = next(iter(self._ages.items()))
+        self._remove(guild_id, message_id)
+
+    def sweep(self) -> int:
+        """Drops the messages older than `max_age` from every guild.
+
+        Returns
+        -------
+        int
+            The amount of messages dropped.
+        """
+        deadline = time.monotonic() - self.max_age
+        dropped = 0
+        while self._ages:
+            message_id, guild_id = next(iter(self._ages.items()))
+            if self._guilds[guild_id][message_id].stored_at >= deadline:
+                break
+            self._remove(guild_id, message_id)
+            dropped += 1
+        return dropped
+
+    def add(self, message: discord.Message) -> None:
+        """Stores a message.
+
+        Parameters
+        ----------
+        message : discord.Message
+            The message, sent in a guild.
+        """
+        self.sweep()
+        guild_id = message.guild.id
+        self._remove(guild_id, message.id)
+        messages = self._guilds.get(guild_id)
+        if messages is None:
+            messages = self._guilds[guild_id] = OrderedDict()
+
+        messages[message.id] = StoredMessage(message)
+        self._ages[message.id] = guild_id
+        if len(messages) > self.per_guild:
+            self._remove(guild_id, next(iter(messages)))
+        while len(self._ages) > self.max_messages:
+            self._pop_oldest()
+
+    def get(self, guild_id: int, message_id: int) -> Optional[StoredMessage]:
+        """Gets a stored message, marking it as recently used.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the guild the message was sent in.
+        message_id : int
+            The ID of the message.
+
+        Returns
+        -------
+        Optional[StoredMessage]
+            The message if it is stored.
+        """
+        messages = self._guilds.get(guild_id)
+        if messages is None or message_id not in messages:
+            return None
+        messages.move_to_end(message_id)
+        return messages[message_id]
+
+    def pop(self, guild_id: int, message_id: int) -> Optional[StoredMessage]:
+        """Removes a stored message, e.g. after it got deleted.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the guild the message was sent in.
+        message_id : int
+            The ID of the message.
+
+        Returns
+        -------
+        Optional[StoredMessage]
+            The message if it was stored.
+        """
+        messages = self._guilds.get(guild_id)
+        if messages is None or message_id not in messages:
+            return None
+        return self._remove(guild_id, message_id)
+
+    def clear(self, guild_id: Optional[int] = None) -> None:
+        """Removes the stored messages.
+
+        Parameters
+        ----------
+        guild_id : Optional[int]
+            Only remove the messages of this guild.
+        """
+        if guild_id is None:
+            self._guilds.clear()
+            self._ages.clear()
+        else:
+            for message_id in self._guilds.pop(guild_id, {}):
+                self._ages.pop(message_id, None)
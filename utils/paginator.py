@@ -17,11 +17,13 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
 import asyncio
-from datetime import datetime
+from collections import OrderedDict
 import discord
 
 from discord.ext import menus
 from discord.ext.menus import First, Last
+from utils.artists import ARTIST_PAGE_PROJECTION
+from utils.utils import Artist
 
 class RoboPages(menus.MenuPages, inherit_buttons=False):
     def __init__(self, source, *args, **kwargs):
@@ -148,46 +150,187 @@ class RoboPages(menus.MenuPages, inherit_buttons=False):
         return await super().send_initial_message(ctx, channel)
         
             
-class ArtistEntry:
-    def __init__(self, artist):
-        self.name = artist.name
-        self.music = artist.music
-        self.release = artist.release
-        self.added = artist.added
-        self.avatar = artist.avatar
-        self.searches = artist.searches
-
-    def __str__(self) -> str:
-        return (
-            f'**Name:** {self.name}\n'
-            f'**Music:** {self.music}\n'
-            f'**With DSCN since:** {datetime.strftime(self.added, "%d/%m/%Y")}\n'
-            f'**Release:** {self.release}'
-        )
+class ArtistPageSource(menus.PageSource):
+    def __init__(self, client, *, sort, index=None, limit=None, per_page=1, show_searches=False, show_unique=False, cache_size=5):
+        """A page source which fetches the artists of a page from the database when it is shown.
+
+        Only the last `cache_size` pages are kept, so an open menu holds a few artists
+        instead of the whole collection. Artists already in the artist index are shown
+        using the indexed record instead of building a new one.
 
-class ArtistPageSource(menus.ListPageSource):
-    def __init__(self, entries, *, per_page=1, show_searches=False):
+        Parameters
+        ----------
+        client : Client
+            The client of the `Artists` collection.
+        sort : list[tuple[str, int]]
+            The sort specification, should end with a unique key so pages are stable.
+        index : Optional[ArtistIndex]
+            The artist index to take the records from.
+        limit : Optional[int]
+            The maximum amount of artists to page through, by default all of them.
+        per_page : Optional[int]
+            The amount of artists per page, by default `1`.
+        show_searches : Optional[bool]
+            Whether to show the searches in the footer, by default `False`.
+        show_unique : Optional[bool]
+            Whether to show the unique searches in the footer, by default `False`.
+        cache_size : Optional[int]
+            The amount of pages to keep in memory, by default `5`.
+        """
+        self.client = client
+        self.sort = sort
+        self.index = index
+        self.limit = limit
+        self.per_page = per_page
         self.show_searches = show_searches
-        super().__init__(entries, per_page=per_page)
+        self.show_unique = show_unique
+        self.cache_size = cache_size
+        self.total = 0
+        self._cache = OrderedDict()
+
+    async def prepare(self):
+        total = await self.client.count_documents({})
+        if self.limit is not None:
+            total = min(total, self.limit)
+        self.total = total
+        if total == 0:
+            raise menus.MenuError('There are no artists to show.')
+
+    def is_paginating(self):
+        return self.total > self.per_page
+
+    def get_max_pages(self):
+        pages, left_over = divmod(self.total, self.per_page)
+        if left_over:
+            pages += 1
+        return pages
+
+    async def get_page(self, page_number):
+        if page_number in self._cache:
+            self._cache.move_to_end(page_number)
+            return self._cache[page_number]
+
+        skip = page_number * self.per_page
+        limit = min(self.per_page, self.total - skip)
+        if limit <= 0:
+            # a limit of 0 would return every artist
+            return None
+        cursor = self.client.find({}, ARTIST_PAGE_PROJECTION).sort(self.sort).skip(skip).limit(limit)
+        entries = [self._to_artist(document) async for document in cursor]
+        if not entries:
+            # the artists were deleted after the menu was opened
+            return None
+        page = entries[0] if self.per_page == 1 else entries
+
+        self._cache[page_number] = page
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return page
+    
+    def _to_artist(self, document):
+        if self.index is not None and self.index.ready:
+            artist = self.index.get(document['name'])
+            if artist is not None and artist.name == document['name']:
+                return artist
+        return Artist(document)
         
     async def format_page(self, menu: menus.Menu, entries):
+        if not entries:
+            return 'The artists on this page were removed.'
+
         pages = []
-        pages.append(str(entries))
+        pages.append(entries.summary)
         menu.embed.set_thumbnail(url=entries.avatar)
             
         maximum = self.get_max_pages()
-        if maximum > 1 and not self.show_searches:
-            footer = f'Page {menu.current_page+1}/{maximum} (Total {len(self.entries)} Artists)'
-            menu.embed.set_footer(text=footer)
-        elif maximum > 1 and self.show_searches:
+        if maximum > 1 and self.show_searches:
             footer = f'Page {menu.current_page+1}/{maximum} (Total {entries.searches} searches)'
             menu.embed.set_footer(text=footer)
+        elif maximum > 1 and self.show_unique:
+            footer = f'Page {menu.current_page+1}/{maximum} (About {entries.unique_searches} users searched)'
+            menu.embed.set_footer(text=footer)
+        elif maximum > 1:
+            footer = f'Page {menu.current_page+1}/{maximum} (Total {self.total} Artists)'
+            menu.embed.set_footer(text=footer)
             
         menu.embed.description = '\n'.join(pages)
         return menu.embed
     
 class ArtistPages(RoboPages):
-    def __init__(self, entries, *, per_page=1, show_searches=False):
-        converted = [ArtistEntry(entry) for entry in entries]
-        super().__init__(ArtistPageSource(converted, per_page=per_page, show_searches=show_searches))
-        self.embed = discord.Embed(colour=0xce0037)
\ No newline at end of file
+    def __init__(self, client, *, sort, index=None, limit=None, per_page=1, show_searches=False, show_unique=False):
+        source = ArtistPageSource(
+            client,
+            sort=sort,
+            index=index,
+            limit=limit,
+            per_page=per_page,
+            show_searches=show_searches,
+            show_unique=show_unique
+        )
+        super().__init__(source)
+        self.embed = discord.Embed(colour=0xce0037)
+
+class EventPageSource(menus.PageSource):
+    def __init__(self, archive, guild_id, *, user_id=None, channel_id=None, type=None, per_page=5):
+        """A page source which reads the events of a page from the event archive when it is shown.
+
+        Parameters
+        ----------
+        archive : EventArchive
+            The event archive.
+        guild_id : int
+            The ID of the guild to show the events of.
+        user_id : Optional[int]
+            Only show the events about this user.
+        channel_id : Optional[int]
+            Only show the events in this channel.
+        type : Optional[str]
+            Only show the events of this type.
+        per_page : Optional[int]
+            The amount of events per page, by default `5`.
+        """
+        self.archive = archive
+        self.guild_id = guild_id
+        self.filters = {'user_id':user_id, 'channel_id':channel_id, 'type':type}
+        self.per_page = per_page
+        self.total = 0
+
+    async def prepare(self):
+        self.total = await self.archive.count(self.guild_id, **self.filters)
+
+    def is_paginating(self):
+        return self.total > self.per_page
+
+    def get_max_pages(self):
+        pages, left_over = divmod(self.total, self.per_page)
+        if left_over:
+            pages += 1
+        return max(pages, 1)
+
+    async def get_page(self, page_number):
+        return await self.archive.search(
+            self.guild_id,
+            limit=self.per_page,
+            offset=page_number * self.per_page,
+            **self.filters
+        )
+
+    async def format_page(self, menu: menus.Menu, entries):
+        pages = []
+        for event in entries:
+            content = event.content if len(event.content) <= 500 else f'{event.content[:497]}...'
+            pages.append(f'**{event.type}** <t:{int(event.created_at)}:R>\n{content}')
+
+        if not pages:
+            pages.append('No logged events found.')
+
+        maximum = self.get_max_pages()
+        menu.embed.set_footer(text=f'Page {menu.current_page+1}/{maximum} (Total {self.total} Events)')
+        menu.embed.description = '\n\n'.join(pages)
+        return menu.embed
+
+class EventPages(RoboPages):
+    def __init__(self, archive, guild_id, *, user_id=None, channel_id=None, type=None):
+        source = EventPageSource(archive, guild_id, user_id=user_id, channel_id=channel_id, type=type)
+        super().__init__(source)
+        self.embed = discord.Embed(colour=0xce0037, title='Logged Events')
@@ -0,0 +1,109 @@
+"""
+Join burst detection
+Copyright (C) 2021  ItsArtemiz (Augadh Verma)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from __future__ import annotations
+
+import discord
+import time
+
+from collections import deque
+from typing import Optional
+
+class JoinBurstDetector:
+    def __init__(self, *, threshold: int = 10, window: float = 10.0):
+        """Detects bursts of members joining a guild, e.g. raids.
+
+        The times of the last `threshold` joins of each guild are kept in a ring
+        buffer. Once `threshold` members joined within `window` seconds the guild is
+        in a burst, and its joins are collected to be logged together instead of one
+        by one until a whole window passes without any.
+
+        Parameters
+        ----------
+        threshold : Optional[int]
+            The amount of joins within a window that starts a burst, by default `10`.
+        window : Optional[float]
+            The length of the window in seconds, by default `10.0`.
+        """
+        self.threshold = threshold
+        self.window = window
+        self._joins: dict[int, deque[float]] = {}
+        self._bursts: dict[int, list[discord.Member]] = {}
+
+    def add(self, member: discord.Member, now: Optional[float] = None) -> bool:
+        """Counts a member joining.
+
+        Parameters
+        ----------
+        member : discord.Member
+            The member who joined.
+        now : Optional[float]
+            The monotonic time of the join, by default now.
+
+        Returns
+        -------
+        bool
+            Whether the join is part of a burst and was collected for :meth:`take`.
+        """
+        now = time.monotonic() if now is None else now
+        guild_id = member.guild.id
+        joins = self._joins.get(guild_id)
+        if joins is None:
+            joins = self._joins[guild_id] = deque(maxlen=self.threshold)
+        joins.append(now)
+
+        if guild_id in self._bursts:
+            self._bursts[guild_id].append(member)
+            return True
+        if len(joins) == self.threshold and now - joins[0] <= self.window:
+            self._bursts[guild_id] = [member]
+            return True
+        return False
+
+    def take(self, guild_id: int) -> list[discord.Member]:
+        """Takes the members collected during the current window of a burst.
+
+        The burst ends when nobody joined during the window.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the guild.
+
+        Returns
+        -------
+        list[discord.Member]
+            The members who joined, oldest first.
+        """
+        members = self._bursts.get(guild_id)
+        if not members:
+            self._bursts.pop(guild_id, None)
+            return []
+        self._bursts[guild_id] = []
+        return members
+
+    def clear(self, guild_id: int) -> None:
+        """Forgets the joins of a guild, e.g. after leaving it.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the guild.
+        """
+        self._joins.pop(guild_id, None)
+        self._bursts.pop(guild_id, None)
@@ -0,0 +1,334 @@
+"""
+Guild Settings Cache
+Copyright (C) 2021  ItsArtemiz (Augadh Verma)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import discord
+import time
+
+from typing import TYPE_CHECKING, Iterable, Optional
+from utils.cache import ExpiringCache, async_cached
+
+if TYPE_CHECKING:
+    from utils.bot import Bot
+
+def compile_prefixes(prefixes: Iterable[str]) -> tuple[str, ...]:
+    """Deduplicates the prefixes and sorts them longest first.
+
+    Sorting longest first means that a single `str.startswith` against the tuple
+    finds a match and the first prefix that matches is the longest one, so `..`
+    is not mistaken for `.`.
+
+    Parameters
+    ----------
+    prefixes : Iterable[str]
+        The prefixes to compile.
+
+    Returns
+    -------
+    tuple[str, ...]
+        The compiled prefixes.
+    """
+    return tuple(sorted({p for p in prefixes if p}, key=len, reverse=True))
+
+class SettingsCache:
+    def __init__(self, bot: Bot, *, maxsize: int = 5000, preload_timeout: float = 10.0):
+        """An in-memory LRU cache of the guild settings documents.
+
+        Guilds without any settings are cached as `None` so that they don't hit
+        the database on every message either. Until :meth:`preload` has run, misses
+        wait for it instead of sending their own queries.
+
+        Parameters
+        ----------
+        bot : Bot
+            The bot, used to access the `Settings` collection.
+        maxsize : Optional[int]
+            The maximum amount of guilds to keep in memory, by default `5000`.
+        preload_timeout : Optional[float]
+            The seconds a miss waits for the preload at most, by default `10.0`.
+        """
+        self.bot = bot
+        self.maxsize = maxsize
+        self.preload_timeout = preload_timeout
+        self._preloaded = asyncio.Event()
+        self._cache = ExpiringCache(None, maxsize=maxsize, name='settings')
+        self._prefixes = ExpiringCache(None, maxsize=maxsize, name='prefixes')
+        self._default_prefixes: Optional[tuple[str, ...]] = None
+        # bumped on every invalidation, so reads which started before one aren't cached
+        self._epoch = 0
+        self._generations: dict[int, int] = {}
+        # concurrent misses for the same guild share one query
+        self._fetch = async_cached(0)(self._find)
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def __contains__(self, guild_id: int) -> bool:
+        return guild_id in self._cache
+
+    def set(self, guild_id: int, settings: Optional[dict]) -> None:
+        """Stores the settings of a guild, evicting the least recently used guild if full.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the guild.
+        settings : Optional[dict]
+            The settings document or `None` if the guild has not been set up.
+        """
+        self._cache[guild_id] = settings
+        self._prefixes.pop(guild_id, None)
+
+    async def get(self, guild_id: int) -> Optional[dict]:
+        """Gets the settings of a guild, fetching them from the database on a cache miss.
+
+        The returned document is shared, so it should not be modified.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the guild.
+
+        Returns
+        -------
+        Optional[dict]
+            The settings document if the guild has been set up.
+        """
+        if not self._preloaded.is_set() and guild_id not in self._cache:
+            try:
+                await asyncio.wait_for(self._preloaded.wait(), timeout=self.preload_timeout)
+            except asyncio.TimeoutError:
+                pass
+
+        cached = self._cache.get(guild_id)
+        if cached is not None:
+            return cached[0]
+
+        generation = self._generation(guild_id)
+        settings = await self._fetch(guild_id)
+        if self._generation(guild_id) == generation:
+            self.set(guild_id, settings)
+        return settings
+
+    def _generation(self, guild_id: int) -> tuple[int, int]:
+        return self._epoch, self._generations.get(guild_id, 0)
+
+    async def _find(self, guild_id: int) -> Optional[dict]:
+        return await self.bot.settings.find_one({'guildId':guild_id})
+
+    @property
+    def default_prefixes(self) -> tuple[str, ...]:
+        """The compiled prefixes used in DMs and in guilds without any prefixes set."""
+        if self._default_prefixes is None:
+            self._default_prefixes = self._compile(['.'])
+        return self._default_prefixes
+
+    def _compile(self, prefixes: Iterable[str]) -> tuple[str, ...]:
+        user_id = self.bot.user.id
+        return compile_prefixes([f'<@{user_id}>', f'<@!{user_id}>', *prefixes])
+
+    async def get_prefixes(self, guild_id: int) -> tuple[str, ...]:
+        """Gets the compiled prefixes of a guild, including the bot's mentions.
+
+        The prefixes are compiled once whenever the guild's settings are (re)loaded.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the guild.
+
+        Returns
+        -------
+        tuple[str, ...]
+            The prefixes sorted longest first.
+        """
+        compiled = self._prefixes.get(guild_id)
+        # a counted lookup, so that busy guilds stay recently used in the settings too
+        if compiled is not None and self._cache.get(guild_id) is not None:
+            return compiled[0]
+
+        settings = await self.get(guild_id)
+        prefixes = settings.get('prefixes') if settings else None
+        compiled = self._compile(prefixes) if prefixes else self.default_prefixes
+        if guild_id in self._cache:
+            self._prefixes[guild_id] = compiled
+        return compiled
+
+    async def preload(self, guild_ids: Iterable[int]) -> tuple[int, float]:
+        """Loads the settings of many guilds in a single query.
+
+        Guilds which don't have a settings document are cached as `None`. Guilds which
+        were cached while the preload was running are left untouched.
+
+        Parameters
+        ----------
+        guild_ids : Iterable[int]
+            The IDs of the guilds to load. Only the first `maxsize` are loaded.
+
+        Returns
+        -------
+        tuple[int, float]
+            The amount of documents loaded and the time taken in milliseconds.
+        """
+        try:
+            start = time.perf_counter()
+            guild_ids = list(guild_ids)[:self.maxsize]
+            missing = set(guild_ids)
+            loaded = 0
+            generations = {guild_id: self._generation(guild_id) for guild_id in guild_ids}
+
+            cursor = self.bot.settings.find({'guildId':{'$in':guild_ids}}, {'_id':False})
+            async for document in cursor:
+                guild_id = document['guildId']
+                missing.discard(guild_id)
+                loaded += 1
+                if guild_id not in self._cache and self._generation(guild_id) == generations[guild_id]:
+                    self.set(guild_id, document)
+
+            for guild_id in missing:
+                if guild_id not in self._cache and self._generation(guild_id) == generations[guild_id]:
+                    self.set(guild_id, None)
+
+            return loaded, (time.perf_counter() - start) * 1000
+        finally:
+            # even a failed preload shouldn't keep the misses waiting
+            self._preloaded.set()
+
+    def invalidate(self, guild_id: int) -> None:
+        """Removes a guild from the cache so that the next lookup reads from the database.
+
+        Should be called after every write to the guild's settings.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the guild.
+        """
+        self._generations[guild_id] = self._generations.get(guild_id, 0) + 1
+        self._cache.pop(guild_id, None)
+        self._prefixes.pop(guild_id, None)
+        self._fetch.invalidate(guild_id)
+        self.bot.log_channels.invalidate(guild_id)
+
+    def clear(self) -> None:
+        """Removes every guild from the cache."""
+        self._epoch += 1
+        self._generations.clear()
+        self._cache.clear()
+        self._prefixes.clear()
+        self._fetch.clear()
+        self.bot.log_channels.clear()
+
+class LogChannelResolver:
+    def __init__(self, bot: Bot, *, maxsize: int = 5000):
+        """Resolves and caches the log channel of each guild.
+
+        Guilds without a usable log channel are cached too. An entry is dropped whenever the
+        guild's settings are invalidated or its log channel is deleted.
+
+        Parameters
+        ----------
+        bot : Bot
+            The bot, used to access the guild settings.
+        maxsize : Optional[int]
+            The maximum amount of guilds to keep in memory, by default `5000`.
+        """
+        self.bot = bot
+        self.maxsize = maxsize
+        self._cache = ExpiringCache(None, maxsize=maxsize, name='log_channels')
+        self._epoch = 0
+        self._generations: dict[int, int] = {}
+        # concurrent misses for the same guild share one lookup and fetch
+        self._resolve = async_cached(0, key=lambda guild: guild.id)(self._find)
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    async def get(self, guild: discord.Guild) -> Optional[discord.TextChannel]:
+        """Gets the log channel of a guild.
+
+        Parameters
+        ----------
+        guild : discord.Guild
+            The guild.
+
+        Returns
+        -------
+        Optional[discord.TextChannel]
+            The channel if one is set and still exists.
+        """
+        cached = self._cache.get(guild.id)
+        if cached is not None:
+            channel_id = cached[0]
+            if channel_id is None:
+                return None
+            channel = guild.get_channel(channel_id)
+            if isinstance(channel, discord.TextChannel):
+                return channel
+
+        generation = self._epoch, self._generations.get(guild.id, 0)
+        channel, cache = await self._resolve(guild)
+        if cache and (self._epoch, self._generations.get(guild.id, 0)) == generation:
+            self._cache[guild.id] = channel.id if channel else None
+        return channel
+
+    async def _find(self, guild: discord.Guild) -> tuple[Optional[discord.TextChannel], bool]:
+        # returns the channel and whether the result can be cached
+        settings = await self.bot.settings_cache.get(guild.id)
+        channel_id = settings.get('log') if settings else None
+        if not channel_id:
+            return None, True
+
+        channel = guild.get_channel(channel_id)
+        if channel is None:
+            try:
+                channel = await guild.fetch_channel(channel_id)
+            except (discord.NotFound, discord.Forbidden):
+                channel = None
+            except discord.HTTPException:
+                # might work next time, so don't cache anything
+                return None, False
+
+        if isinstance(channel, discord.TextChannel):
+            return channel, True
+        return None, True
+
+    def invalidate(self, guild_id: int, channel_id: Optional[int] = None) -> None:
+        """Removes a guild from the cache.
+
+        Parameters
+        ----------
+        guild_id : int
+            The ID of the guild.
+        channel_id : Optional[int]
+            Only remove the guild if this is its cached log channel.
+        """
+        cached = self._cache.peek(guild_id)
+        if channel_id is None or (cached is not None and cached[0] == channel_id):
+            self._generations[guild_id] = self._generations.get(guild_id, 0) + 1
+            self._cache.pop(guild_id, None)
+            self._resolve.invalidate(discord.Object(id=guild_id))
+
+    def clear(self) -> None:
+        """Removes every guild from the cache."""
+        self._epoch += 1
+        self._generations.clear()
+        self._cache.clear()
+        self._resolve.clear()
@@ -29,20 +29,75 @@ from discord.ext import commands
 DSCN_GUILD = 781796557490094100
 
 class Artist:
+    """An immutable artist record, shared by the artist index, the paginator and the embeds.
+    
+    Use :meth:`replace` to get a modified copy.
+    """
+    __slots__ = ('name', 'music', 'release', 'avatar', 'added', 'searches', 'aliases', 'searchers', 'unique_searches')
+    
+    name: str
+    music: str
+    release: str
+    avatar: str
+    added: datetime
+    searches: int
+    aliases: tuple[str, ...]
+    searchers: bytes
+    unique_searches: int
+    
     def __init__(self, data: dict):
-        self.name: str = data['name']
-        self.music: str = data['music']
-        self.release: str = data['release']
-        self.avatar: str = data['avatar']
-        self.added: datetime = data['added']
-        self.searches: int = data.get('searches', 0)
-        self.aliases: list[str] = data.get('aliases', [])
+        init = object.__setattr__
+        init(self, 'name', data['name'])
+        init(self, 'music', data['music'])
+        init(self, 'release', data['release'])
+        init(self, 'avatar', data['avatar'])
+        init(self, 'added', data['added'])
+        init(self, 'searches', data.get('searches', 0))
+        init(self, 'aliases', tuple(data.get('aliases', ())))
+        init(self, 'searchers', data.get('searchers', b''))
+        init(self, 'unique_searches', data.get('uniqueSearches', 0))
+        
+    def __setattr__(self, name: str, value) -> None:
+        raise AttributeError(f'{self.__class__.__name__} is immutable, use replace() instead')
+    
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError(f'{self.__class__.__name__} is immutable')
         
     def __repr__(self) -> str:
         return (f'<Artist name="{self.name}" music="{self.music}" added={self.added!r}'
-                f' playlist="<{self.release}>" searches={self.searches} aliases={self.aliases!r}'
+                f' playlist="<{self.release}>" searches={self.searches} unique_searches={self.unique_searches}'
+                f' aliases={list(self.aliases)!r}'
                 f' avatar="<{self.avatar}>">'
         )
+        
+    def replace(self, **changes) -> Artist:
+        """Makes a copy of the artist with some fields changed.
+
+        Parameters
+        ----------
+        **changes
+            The attributes to change and their new values.
+
+        Returns
+        -------
+        Artist
+            The modified copy.
+        """
+        artist = object.__new__(Artist)
+        for field in self.__slots__:
+            object.__setattr__(artist, field, changes.pop(field, getattr(self, field)))
+        if changes:
+            raise TypeError(f'Artist has no field(s): {", ".join(changes)}')
+        return artist
+    
+    @property
+    def summary(self) -> str:
+        return (
+            f'**Name:** {self.name}\n'
+            f'**Music:** {self.music}\n'
+            f'**With DSCN since:** {datetime.strftime(self.added, "%d/%m/%Y")}\n'
+            f'**Release:** {self.release}'
+        )
     
     @property
     def embed(self) -> discord.Embed:
@@ -104,16 +159,7 @@ async def log(
     Optional[discord.Message]
         Returns a `Message` if sent.
     """
-    settings = await bot.settings.find_one({'guildId':guild.id})
-    if settings is None or settings.get('log', None) is None:
-        return
-    
-    channel_id = settings['log']
-
-    channel = guild.get_channel(channel_id)
-    if channel is None:
-        channel = await guild.fetch_channel(channel_id)
-        
+    channel = await bot.log_channels.get(guild)
     if channel is None:
         return
     